@@ -13,23 +13,987 @@ import sys
 import logging
 
 import pandas as pd
-import matplotlib as mpl
-
-# mpl.use("TkAgg")
-import seaborn as sns
-
-from matplotlib import pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib import ticker
-from matplotlib.dates import MO
-
 import numpy as np
 import glob
 import argparse
+import fnmatch
+import time
+import datetime
+import functools
+import io
+import json
+import platform
+import threading
+import uuid
+import contextlib
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Plotting stack is only imported by use_charts(True), data only runs (--no-charts) never load it
+mpl = plt = sns = mdates = MO = None
+DRAW_CHARTS = False
+
+
+def use_charts(enabled):
+    global mpl, plt, sns, mdates, MO, DRAW_CHARTS
+    if enabled and plt is None:
+        import matplotlib as mpl
+
+        # mpl.use("TkAgg")
+        import seaborn as sns
+
+        from matplotlib import pyplot as plt
+        import matplotlib.dates as mdates
+        from matplotlib.dates import MO
+
+        from pandas.plotting import register_matplotlib_converters
+
+        register_matplotlib_converters()
+    DRAW_CHARTS = enabled
+
+
+# pyarrow is optional, if installed it is used as a multithreaded csv parser
+try:
+    import pyarrow  # noqa: F401
+
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+
+# Columns each stage uses, pruned at parse time. Stages not listed read every column (they write the
+# whole export out as csv, as does the main page summary stage, "pages" is for the stages that only
+# use these). Columns missing in some TrakCare versions are simply not returned.
+
+STAGE_COLUMNS = {
+    "episode_size_app": [
+        "RunDate",
+        "RunTime",
+        "EpisodeCountTotal",
+        "EpisodeCountInpatient",
+        "EpisodeCountOutpatient",
+        "EpisodeCountEmergency",
+        "LabEpisodeCountTotal",
+    ],
+    "episode_size_db": ["RunDate", "Name", "SizeinMB", "FreeSpace"],
+    "globals": ["RunDate", "DataBasePath", "GlobalName", "SizeAllocated"],
+    "attribution_db": [
+        "RunDate",
+        "Name",
+        "SizeinMB",
+        "FreeSpace",
+        "Directory",
+        "DatabaseDirectory",
+        "DataBasePath",
+        "Path",
+    ],
+    "pages": ["RunDate", "pName", "TotalHits", "SumPGlobals", "AvgPGlobals", "MaxPGlobals", "SumPTime"],
+    "rollup_app": [
+        "RunDate",
+        "EpisodeCountTotal",
+        "EpisodeCountInpatient",
+        "EpisodeCountOutpatient",
+        "EpisodeCountEmergency",
+        "OrderCountTotal",
+        "EpisodePeakPerHourCount",
+    ],
+}
+
+# Stages that read each kind of export in mainline, None is a stage that reads (and writes out) every column.
+# Exports are prefetched with just the columns of these stages.
+
+EXPORT_STAGES = {
+    "MonitorApp": [None, "episode_size_app", "rollup_app"],
+    "MonitorDatabase": [None, "episode_size_db", "attribution_db"],
+    "MonitorGlobals": ["globals"],
+    "MonitorJournals": [None],
+    "MonitorPageSummary": [None, "pages"],
+}
+
+
+# Exports in archives ----------------------------------------------------------------------
+# ExportAll bundles can be read without extracting them. A source is a plain .txt or .txt.gz path, or
+# "archive::member" for a member of a .zip or .tar.gz, streamed straight into the parser.
+
+ARCHIVE_SEP = "::"
+ARCHIVE_PATTERNS = ["*.zip", "*.tar.gz", "*.tgz"]
+
+
+def is_archive(path):
+    return any(fnmatch.fnmatch(path.lower(), pattern) for pattern in ARCHIVE_PATTERNS)
+
+
+def is_export(path, kind="Monitor*"):
+    name = os.path.basename(path)
+    return fnmatch.fnmatch(name, "*" + kind + ".txt") or fnmatch.fnmatch(name, "*" + kind + ".txt.gz")
+
+
+# Members of an archive, cached while the archive is unchanged (listing a .tar.gz reads all of it)
+
+
+@functools.lru_cache(maxsize=64)
+def archive_members(archive, mtime):
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as z:
+            return tuple(info.filename for info in z.infolist() if not info.is_dir())
+    with tarfile.open(archive, "r:*") as t:
+        return tuple(member.name for member in t.getmembers() if member.isfile())
+
+
+# Every source of one kind of export (eg "MonitorApp") in a folder and its archives, in one archive, or -d is
+# a single export
+
+
+def monitor_exports(DIRECTORY, kind):
+    if os.path.isfile(DIRECTORY) and is_archive(DIRECTORY):
+        archives, sources = [DIRECTORY], []
+    elif os.path.isfile(DIRECTORY):
+        archives, sources = [], [DIRECTORY] if is_export(DIRECTORY, kind) else []
+    else:
+        archives = sorted(path for path in glob.glob(DIRECTORY + "/*") if is_archive(path))
+        sources = glob.glob(DIRECTORY + "/*" + kind + ".txt") + glob.glob(DIRECTORY + "/*" + kind + ".txt.gz")
+    for archive in archives:
+        for member in archive_members(archive, os.path.getmtime(archive)):
+            if is_export(member, kind):
+                sources.append(archive + ARCHIVE_SEP + member)
+    return sources
+
+
+# Outputs go in the -d folder, or next to the archive or export if -d is a file
+
+
+def output_folder(DIRECTORY):
+    return os.path.dirname(os.path.abspath(DIRECTORY)) if os.path.isfile(DIRECTORY) else DIRECTORY
+
+
+# Name used for output files eg "SITE_MonitorApp", members of an archive are prefixed with the archive name
+# eg "site_export_SITE_MonitorApp", so exports of the same site in two bundles don't overwrite each other
+
+
+def export_name(filename):
+    name = os.path.basename(filename.split(ARCHIVE_SEP)[-1])
+    if name.endswith(".gz"):
+        name = name[:-3]
+    name = os.path.splitext(name)[0]
+    if ARCHIVE_SEP in filename:
+        archive = os.path.basename(filename.split(ARCHIVE_SEP)[0])
+        for suffix in [".tar.gz", ".tgz", ".zip"]:
+            if archive.lower().endswith(suffix):
+                archive = archive[: -len(suffix)]
+                break
+        name = archive + "_" + name
+    return name
+
+
+def export_mtime(filename):
+    return os.path.getmtime(filename.split(ARCHIVE_SEP)[0])
+
+
+# Open a source for pd.read_csv, plain and .gz paths are passed through (pandas reads gzip itself)
+
+
+@contextlib.contextmanager
+def open_export(filename):
+    if ARCHIVE_SEP not in filename:
+        yield filename
+        return
+    archive, member = filename.split(ARCHIVE_SEP, 1)
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as z, z.open(member) as source:
+            yield source
+    else:
+        with tarfile.open(archive, "r:*") as t, t.extractfile(member) as source:
+            yield source
+
+
+# Export layouts -------------------------------------------------------------------------
+# Before the full parse each export is sniffed: header plus a sample of rows. The sample says which
+# TrakCare layout it is (optional columns there and filled or not), the dtypes and the date format, so the
+# full parse doesn't have to guess. Exports missing columns the stages need are found before anything runs.
+# required is every column a stage reads without checking for it first, optional columns are checked for.
+
+EXPORT_LAYOUTS = {
+    "MonitorPageSummary": {
+        "required": ["RunDate", "pName", "TotalHits", "SumPGlobals", "AvgPGlobals", "MaxPGlobals", "SumPTime"],
+        "optional": [],
+    },
+    "MonitorJournals": {"required": ["Size", "Reason"], "optional": []},
+    "MonitorGlobals": {"required": ["RunDate", "DataBasePath", "GlobalName", "SizeAllocated"], "optional": []},
+    "MonitorDatabase": {"required": ["RunDate", "Name", "SizeinMB", "FreeSpace"], "optional": []},
+    "MonitorApp": {
+        "required": [
+            "RunDate",
+            "RunTime",
+            "EpisodeCountTotal",
+            "EpisodeCountInpatient",
+            "EpisodeCountOutpatient",
+            "OrderCountTotal",
+            "EpisodePeakPerHourCount",
+            "EpisodePeakPerMinuteCount",
+        ],
+        "optional": ["EpisodeCountEmergency", "LabEpisodeCountTotal"],
+    },
+}
+
+SNIFF_ROWS = 2000
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%m/%d/%Y",
+    "%m/%d/%Y %H:%M:%S",
+    "%Y/%m/%d",
+    "%d-%m-%Y",
+]
+
+# filename -> layout found by sniff_export()
+
+EXPORT_SCHEMAS = {}
+
+
+# Kind of export from the end of the file name, not the archive name (eg "MonitorDatabase_backup.zip")
+
+
+def export_kind(filename):
+    member = filename.split(ARCHIVE_SEP)[-1]
+    return next((kind for kind in EXPORT_LAYOUTS if is_export(member, kind)), None)
+
+
+# Output name without the kind, the same for every export of one site (and archive) eg "site_export_SITE_"
+
+
+def export_prefix(filename):
+    name, kind = export_name(filename), export_kind(filename)
+    return name[: -len(kind)] if kind is not None and name.endswith(kind) else name
+
+
+# Formats that read every distinct date, the first in DATE_FORMATS that fits and, if the day and month can be
+# either way round (every day is 12 or less, often the case for one or two export days), the swapped order too.
+# Empty if none fits (left to pandas).
+
+
+def date_formats(values):
+    values = pd.Series(pd.unique(values.dropna().astype(str)))
+    if values.empty:
+        return []
+    for date_format in DATE_FORMATS:
+        if pd.to_datetime(values, format=date_format, errors="coerce").notna().all():
+            if date_format.startswith("%Y"):
+                return [date_format]
+            swapped = date_format.replace("%d", "%_").replace("%m", "%d").replace("%_", "%m")
+            if pd.to_datetime(values, format=swapped, errors="coerce").notna().all():
+                return [date_format, swapped]
+            return [date_format]
+    return []
+
+
+# The one format that reads every distinct date, None if unresolved (day/month order) or left to pandas
+
+
+def detect_date_format(values):
+    formats = date_formats(values)
+    return formats[0] if len(formats) == 1 else None
+
+
+# The sniff sees only the first rows (often a single day), a day/month order left open there is settled from
+# every date once the export is parsed
+
+
+def resolve_date_format(layout, values):
+    date_format = detect_date_format(pd.Series(values))
+    if date_format is not None:
+        layout["date_format"] = date_format
+        layout["date_formats"] = [date_format]
+
+
+# Layout of one export, raises ValueError if it is malformed
+
+
+def sniff_export(filename):
+    if filename in EXPORT_SCHEMAS:
+        return EXPORT_SCHEMAS[filename]
+
+    kind = export_kind(filename)
+    expected = EXPORT_LAYOUTS.get(kind, {"required": [], "optional": []})
+    try:
+        with open_export(filename) as source:
+            sample = pd.read_csv(source, sep="\t", encoding="ISO-8859-1", nrows=SNIFF_ROWS)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, KeyError, EOFError) as e:
+        raise ValueError("malformed export %s: %s" % (export_name(filename), str(e).strip()))
+
+    missing = [c for c in expected["required"] if c not in sample.columns]
+    if missing:
+        raise ValueError("malformed export %s: missing %s" % (export_name(filename), ", ".join(missing)))
+    if sample.empty:
+        raise ValueError("malformed export %s: no rows" % export_name(filename))
+    date_column = sample.columns[2 if kind == "MonitorJournals" else 0]
+    formats = date_formats(sample[date_column])
+    if not formats and pd.to_datetime(sample[date_column], errors="coerce").isna().all():
+        raise ValueError("malformed export %s: no dates in %s" % (export_name(filename), date_column))
+
+    # Optional columns are read if in the header, columns blank in the whole export are dropped after parsing
+    absent = [c for c in expected["optional"] if c not in sample.columns]
+
+    # Text stays text and floats are floats, integers are left to the parser (a blank later on would fail)
+    dtypes = {}
+    for column in sample.columns:
+        if sample[column].dtype == object:
+            dtypes[column] = object
+        elif sample[column].dtype == float and not sample[column].isna().all():
+            dtypes[column] = "float64"
+
+    layout = {
+        "kind": kind,
+        "version": "without " + ", ".join(absent) if absent else "full",
+        "columns": list(sample.columns),
+        "optional": [c for c in expected["optional"] if c in sample.columns],
+        "dtypes": dtypes,
+        "date_column": date_column,
+        "date_format": formats[0] if len(formats) == 1 else None,
+        "date_formats": formats,
+    }
+    EXPORT_SCHEMAS[filename] = layout
+    return layout
+
+
+# Sniff a list of exports, print the layout of each and leave out the malformed ones
+
+
+def checked_exports(filenames):
+    checked = []
+    for filename in filenames:
+        try:
+            layout = sniff_export(filename)
+        except (ValueError, UnicodeDecodeError) as e:
+            print("Skipping %s" % str(e))
+            continue
+        print(
+            "Layout: %s %s, dates %s"
+            % (export_name(filename), layout["version"], layout["date_format"] or "unresolved (day/month order)")
+        )
+        checked.append(filename)
+    return checked
+
+
+# Dates ------------------------------------------------------------------------------------
+# Exports repeat a few hundred distinct dates millions of times. Each distinct text is converted once with an
+# explicit format (from the export layout, or detected from the values) and mapped back to the rows by code.
+# Conversions are memoized per format for the whole run, so the next stage or export reuses them. Dates whose
+# day/month order could not be settled are converted each time, never memoized.
+
+DATE_MEMO = {}
+DATE_MEMO_LOCK = threading.Lock()
+
+
+def to_dates(values, date_format=None, errors="raise"):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values  # Already converted by an earlier stage
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Index(uniques).astype(str)
+    if date_format is None:
+        date_format = detect_date_format(pd.Series(uniques))
+    if date_format is None:
+        # Order unresolved, pandas guesses for these values only. A guess is never memoized, another export can
+        # have the day and month the other way round.
+        memo = pd.Series(pd.to_datetime(uniques, errors=errors), index=uniques)
+    else:
+        # Only dates that converted are memoized, a text that failed with errors="coerce" fails again next time
+        with DATE_MEMO_LOCK:
+            memo = DATE_MEMO.get(date_format, pd.Series(dtype="datetime64[ns]"))
+        new = uniques[~uniques.isin(memo.index)]
+        if len(new):
+            converted = pd.Series(pd.to_datetime(new, format=date_format, errors=errors), index=new)
+            with DATE_MEMO_LOCK:
+                stored = pd.concat([DATE_MEMO.get(date_format, memo), converted.dropna()])
+                DATE_MEMO[date_format] = stored[~stored.index.duplicated()]
+            memo = pd.concat([memo, converted])
+
+    dates = memo.reindex(uniques).to_numpy(dtype="datetime64[ns]")[codes]
+    dates[codes < 0] = np.datetime64("NaT")  # Blank in the export
+    if isinstance(values, pd.Index):
+        return pd.DatetimeIndex(dates, name=values.name)
+    return pd.Series(dates, index=values.index, name=values.name)
+
+
+# Exports parsed ahead of the stages by prefetch_exports(), filename -> dataframe with every column
+
+PREFETCHED = {}
+
+# Only rows in this date window are kept when reading exports, (since, day after until), None is open ended
 
-from pandas.plotting import register_matplotlib_converters
+DATE_WINDOW = (None, None)
+WINDOW_CHUNK_ROWS = 500000
 
-register_matplotlib_converters()
+
+def set_date_window(since=None, until=None):
+    global DATE_WINDOW
+    DATE_WINDOW = (
+        None if since is None else pd.Timestamp(since),
+        None if until is None else pd.Timestamp(until) + pd.Timedelta(days=1),
+    )
+
+
+# Read an export, the columns asked for, with the sniffed dtypes. With a date window stream it in chunks and drop
+# rows outside the window as each chunk is parsed, so they are never held in memory. The date is RunDate (first
+# column) or for journals the create date (third column). If the day/month order is still open, rows in the window
+# either way round are kept until every date has been seen, then the order is settled and the rest dropped.
+# Optional columns blank for the whole export (or window) are dropped.
+
+
+def in_window(dates):
+    since, until = DATE_WINDOW
+    keep = dates.notna()
+    if since is not None:
+        keep &= dates >= since
+    if until is not None:
+        keep &= dates < until
+    return keep
+
+
+def read_export(filename, usecols=None, engine="c"):
+    layout = sniff_export(filename)
+    columns = [c for c in layout["columns"] if usecols is None or usecols(c)]
+    dtypes = {c: dtype for c, dtype in layout["dtypes"].items() if c in columns}
+    read = dict(sep="\t", encoding="ISO-8859-1", usecols=columns, dtype=dtypes)
+    date_column = layout["date_column"]
+
+    since, until = DATE_WINDOW
+    if since is None and until is None:
+        with open_export(filename) as source:
+            df = pd.read_csv(source, engine=engine, **read)
+        if layout["date_format"] is None and date_column in df.columns:
+            resolve_date_format(layout, df[date_column].dropna().unique())
+    else:
+        formats = layout["date_formats"] or [None]
+        chunks, seen = [], set()
+        with open_export(filename) as source:
+            for chunk in pd.read_csv(source, chunksize=WINDOW_CHUNK_ROWS, **read):
+                keep = np.zeros(len(chunk), dtype=bool)
+                for date_format in formats:
+                    keep |= in_window(to_dates(chunk[date_column], date_format, errors="coerce")).to_numpy()
+                if len(formats) > 1:
+                    seen.update(chunk[date_column].dropna().unique())
+                chunks.append(chunk[keep])
+        df = pd.concat(chunks, ignore_index=True)
+        if len(formats) > 1:
+            resolve_date_format(layout, list(seen))
+            df = df[in_window(to_dates(df[date_column], layout["date_format"], errors="coerce"))]
+            df = df.reset_index(drop=True)
+
+    blank = [c for c in layout["optional"] if c in df.columns and df[c].isna().all()]
+    if blank and "blank" not in layout:
+        layout["blank"] = blank
+        print("Layout: %s without %s (all blank)" % (export_name(filename), ", ".join(blank)))
+    return df.drop(columns=blank)
+
+
+# Parse all the exports at once in a thread pool (one file per core) so startup is bounded by the largest file,
+# not the sum. Only the columns the mainline stages use are parsed. Stages then take their columns from
+# PREFETCHED through read_monitor(), the last stage to use an export takes it out so the memory is freed.
+
+
+def prefetch_columns(filename):
+    stages = EXPORT_STAGES.get(export_kind(filename), [None])
+    if None in stages:
+        return None
+    return set().union(*(STAGE_COLUMNS[stage] for stage in stages))
+
+
+def prefetch_exports(filenames):
+    def read(filename):
+        columns = prefetch_columns(filename)
+        df = read_export(filename, usecols=None if columns is None else columns.__contains__, engine=CSV_ENGINE)
+        # pyarrow turns date and time text into date/time objects, keep text like the c parser does
+        for column in df.columns[df.dtypes == object]:
+            first = df[column].dropna().head(1)
+            if len(first) and isinstance(first.iloc[0], (datetime.date, datetime.time)):
+                df[column] = df[column].astype(str).where(df[column].notna())
+        return filename, df
+
+    PREFETCHED.clear()  # Anything left from a run that failed part way
+    with ThreadPoolExecutor(max_workers=max(1, min(len(filenames), os.cpu_count() or 1))) as pool:
+        PREFETCHED.update(pool.map(read, filenames))
+
+
+# Free prefetched exports no stage still needs (stages after this read them from the file)
+
+
+def release_exports(filenames):
+    for filename in filenames:
+        PREFETCHED.pop(filename, None)
+
+
+# Read a tab separated Monitor export, only the columns in the stage manifest. index_col (by position,
+# so only for stages that read every column) is parsed as a date and used as the index.
+# Uses the prefetched frame if there is one, a copy as stages change their frames. The last stage to use an
+# export (last=True) takes the prefetched frame itself.
+
+
+def read_monitor(filename, stage=None, index_col=None, last=False):
+    columns = STAGE_COLUMNS.get(stage)
+    if filename in PREFETCHED:
+        df = PREFETCHED.pop(filename) if last else PREFETCHED[filename]
+        if columns is not None:
+            df = df[[c for c in df.columns if c in columns]].copy()
+        elif not last:
+            df = df.copy()
+    else:
+        df = read_export(filename, usecols=None if columns is None else (lambda column: column in columns))
+
+    if index_col is not None:
+        df = df.set_index(df.columns[index_col])
+        df.index = to_dates(df.index, sniff_export(filename)["date_format"])
+    return df
+
+
+# substring mapping is a thing - one global can have many parts, need to break on path and Global
+#  DataBasePath	        GlobalName	SizeAllocated
+# /db/AUDIT0/	AUD	    57949
+# /db/AUDIT1/	AUD	    103617
+# /db/AUDIT2/	AUD	    45235
+# /db/AUDIT3/	AUD	    41815
+# etc
+# Flatten DataBasePath to a name and add Full_Global, path + global name
+
+
+def add_full_global(df_master_gb):
+    path = df_master_gb["DataBasePath"]
+    path = path.replace("\\\\", "_", regex=True)
+    path = path.replace(":", "_", regex=True)
+    path = path.replace("/", "_", regex=True)
+    path = path.replace("__", "", regex=True)
+    df_master_gb["DataBasePath"] = path
+    df_master_gb["Full_Global"] = path.str[1:] + df_master_gb["GlobalName"]
+    return df_master_gb
+
+
+# Output files -----------------------------------------------------------------------------------------------------
+# Outputs are written to a hidden temporary file in the same folder and renamed over the real name when complete, so
+# nobody (another export processed at the same time, or someone else's run on the same share) ever sees a half written
+# file, the last run to finish wins. Each run keeps a manifest of what it wrote in all_manifest, written at the start
+# (status running) and again at the end. A file written twice in one run is reported, the first copy was lost.
+RUN_MANIFEST = None
+RUN_MANIFEST_LOCK = threading.Lock()
+
+
+def start_run(DIRECTORY, exports):
+    global RUN_MANIFEST
+    started = datetime.datetime.now()
+    RUN_MANIFEST = {
+        "run": started.strftime("%Y%m%d_%H%M%S") + "_" + platform.node() + "_" + str(os.getpid()),
+        "directory": os.path.abspath(DIRECTORY),
+        "started": started.isoformat(timespec="seconds"),
+        "status": "running",
+        "exports": [export_name(export) for export in exports],
+        "outputs": {},
+    }
+    write_manifest(DIRECTORY, RUN_MANIFEST)
+
+
+def finish_run(DIRECTORY):
+    global RUN_MANIFEST
+    manifest, RUN_MANIFEST = RUN_MANIFEST, None
+    if manifest is not None:
+        manifest["finished"] = datetime.datetime.now().isoformat(timespec="seconds")
+        manifest["status"] = "finished"
+        write_manifest(DIRECTORY, manifest)
+
+
+def write_manifest(DIRECTORY, manifest):
+    with RUN_MANIFEST_LOCK:
+        text = json.dumps(manifest, indent=2)
+    with open_output(DIRECTORY + "/all_manifest/" + manifest["run"] + ".json", record=False) as temp:
+        with open(temp, "w") as f:
+            f.write(text)
+
+
+# Output folders in the -d folder. File names in them can hold page and global names from the exports, any path
+# separators in those are made "_" so every output is a file in its folder, never a new sub folder.
+
+OUTPUT_FOLDERS = [
+    "all_out_csv",
+    "all_out_png",
+    "all_database",
+    "all_globals",
+    "all_pages",
+    "all_rollup",
+    "all_compare",
+    "all_manifest",
+]
+
+
+def output_path(path):
+    search = path.replace("\\", "/")
+    end = max((search.rfind("/" + f + "/") + len(f) + 2 for f in OUTPUT_FOLDERS if "/" + f + "/" in search), default=0)
+    if end == 0:
+        return path
+    return path[:end] + path[end:].replace("/", "_").replace("\\", "_")
+
+
+@contextlib.contextmanager
+def open_output(path, record=True):
+    path = output_path(path)
+    folder, name = os.path.split(path)
+    os.makedirs(folder or ".", exist_ok=True)
+    temp = os.path.join(folder, "." + uuid.uuid4().hex[:12] + "." + name)  # Same extension, format is by extension
+    try:
+        yield temp
+        os.replace(temp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp)
+        raise
+
+    if record and RUN_MANIFEST is not None:
+        key = os.path.relpath(path, RUN_MANIFEST["directory"])
+        with RUN_MANIFEST_LOCK:
+            if key in RUN_MANIFEST["outputs"]:
+                print("Output written more than once in this run, first copy lost: %s" % key)
+            RUN_MANIFEST["outputs"][key] = os.path.getsize(path)
+
+
+def write_csv(df, path, **kwargs):
+    with open_output(path) as temp:
+        df.to_csv(temp, **kwargs)
+
+
+def save_figure(path, fig=None, **kwargs):
+    with open_output(path) as temp:
+        (plt if fig is None else fig).savefig(temp, **kwargs)
+
+
+# Compact global histories -----------------------------------------------------------------
+# Most globals are the same size from one day to the next. Keep only the change points of each global in
+# typed arrays: change days and sizes for all globals end to end, with offsets to where each global starts.
+# First/last/growth and top N read these arrays directly, histories are expanded only for the globals charted.
+# Saved as .npz of plain arrays, names (and the DataBasePath of each global as exported) are in order of first
+# appearance in the export.
+
+
+class GlobalHistories:
+    def __init__(self, names, paths, offsets, day, size, last_day, dates):
+        self.names = names  # Global names
+        self.paths = paths  # DataBasePath of each global as exported
+        self.offsets = offsets  # Change points of global i are offsets[i]:offsets[i + 1]
+        self.day = day  # Change point days since 1970-01-01
+        self.size = size  # Size from that day on
+        self.last_day = last_day  # Last day each global was seen
+        self.dates = dates  # Every day in the export
+
+    @classmethod
+    def from_frame(cls, df, paths, name_column="Full_Global", value_column="SizeAllocated"):
+        codes, names = pd.factorize(df[name_column])
+        days = to_dates(df["Date"]).to_numpy().astype("datetime64[D]").astype(np.int32)
+        values = df[value_column].to_numpy()
+
+        # Order by global then day, keep the first row of each global and rows where the size changes
+        order = np.lexsort((days, codes))
+        codes, days, values = codes[order], days[order], values[order]
+        first = np.r_[True, codes[1:] != codes[:-1]]
+        keep = first | np.r_[True, values[1:] != values[:-1]]
+        last = np.r_[codes[1:] != codes[:-1], True]
+        paths = np.asarray(paths, dtype=str)[order][first]
+
+        if np.issubdtype(values.dtype, np.number) and np.all(np.mod(values, 1) == 0):
+            values = values.astype(np.int32 if np.abs(values).max() < 2**31 else np.int64)
+        return cls(
+            np.asarray(names, dtype=str),
+            paths,
+            np.searchsorted(codes[keep], np.arange(len(names) + 1)).astype(np.int64),
+            days[keep],
+            values[keep],
+            days[last],
+            np.unique(days),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(*(npz[key] for key in ["names", "paths", "offsets", "day", "size", "last_day", "dates"]))
+
+    # One history from several built on separate rows (shards), globals are in the order of the parts
+
+    @classmethod
+    def merge(cls, parts):
+        starts = np.cumsum([0] + [len(part.day) for part in parts[:-1]])
+        return cls(
+            np.concatenate([part.names for part in parts]),
+            np.concatenate([part.paths for part in parts]),
+            np.concatenate(
+                [np.zeros(1, dtype=np.int64)] + [part.offsets[1:] + start for part, start in zip(parts, starts)]
+            ),
+            np.concatenate([part.day for part in parts]),
+            np.concatenate([part.size for part in parts]),
+            np.concatenate([part.last_day for part in parts]),
+            np.unique(np.concatenate([part.dates for part in parts])),
+        )
+
+    def save(self, path):
+        with open_output(path) as temp:
+            np.savez_compressed(
+                temp,
+                names=self.names,
+                paths=self.paths,
+                offsets=self.offsets,
+                day=self.day,
+                size=self.size,
+                last_day=self.last_day,
+                dates=self.dates,
+            )
+
+    def __len__(self):
+        return len(self.names)
+
+    # Start, end and growth of every global, no expansion needed
+
+    def summary(self):
+        start = self.size[self.offsets[:-1]]
+        end = self.size[self.offsets[1:] - 1]
+        return pd.DataFrame(
+            {"Full_Global": self.names, "Start Size": start, "End Size": end, "Growth Size": end - start}
+        )
+
+    # Size change of every global on each day it changed, the first day seen is not a change
+
+    def changes(self):
+        codes = np.repeat(np.arange(len(self.names)), np.diff(self.offsets))
+        later = np.r_[False, codes[1:] == codes[:-1]]
+        growth = np.diff(self.size, prepend=self.size[:1])
+        return pd.DataFrame(
+            {
+                "Date": self.day[later].astype("datetime64[D]").astype("datetime64[ns]"),
+                "Full_Global": self.names[codes[later]],
+                "Growth": growth[later],
+            }
+        )
+
+    # Size at the end of each period and the largest size in it, for every global and period it was seen in, as
+    # rollup_table() would give from the per-day rows. Periods are pandas period aliases eg "W", "M".
+
+    def rollup(self, period):
+        period_codes, period_starts = pd.factorize(
+            pd.DatetimeIndex(self.dates.astype("datetime64[D]").astype("datetime64[ns]")).to_period(period).start_time,
+            sort=True,
+        )
+
+        # Every global/period pair, from the period of the first to the period of the last day each global was seen
+        first = np.searchsorted(self.dates, self.day[self.offsets[:-1]])
+        last = np.searchsorted(self.dates, self.last_day, side="right") - 1
+        counts = period_codes[last] - period_codes[first] + 1
+        pair_global = np.repeat(np.arange(len(self.names)), counts)
+        pair_period = np.repeat(period_codes[first] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        # First and last day seen in each pair, size on a day is the last change on or before it
+        lo = np.maximum(np.searchsorted(period_codes, pair_period), first[pair_global])
+        hi = np.minimum(np.searchsorted(period_codes, pair_period, side="right") - 1, last[pair_global])
+        codes = np.repeat(np.arange(len(self.names)), np.diff(self.offsets))
+        keys = codes.astype(np.int64) * 2**33 + self.day + 2**31
+        size_on = lambda g, i: self.size[  # noqa: E731
+            np.searchsorted(keys, g.astype(np.int64) * 2**33 + self.dates[i] + 2**31, side="right") - 1
+        ]
+
+        # Largest is the size on the first day seen or a change later in the period
+        change_period = period_codes[np.searchsorted(self.dates, self.day)]
+        peak = pd.Series(self.size).groupby([codes, change_period]).max()
+        peak = peak.reindex(pd.MultiIndex.from_arrays([pair_global, pair_period])).to_numpy(dtype=float)
+        return pd.DataFrame(
+            {
+                "Period": period_starts[pair_period],
+                "Full_Global": self.names[pair_global],
+                "SizeAllocated End": size_on(pair_global, hi),
+                "SizeAllocated Max": np.fmax(size_on(pair_global, lo), peak).astype(self.size.dtype),
+            }
+        ).sort_values(by=["Period", "Full_Global"], ignore_index=True)
+
+    def top_n(self, n, by="Growth Size"):
+        return self.summary().sort_values(by=[by], ascending=False).head(n)
+
+    # Size of one global on every export day it was seen, back to one row per day
+
+    def history(self, name):
+        i = np.flatnonzero(self.names == name)[0]
+        day, size = self.day[self.offsets[i] : self.offsets[i + 1]], self.size[self.offsets[i] : self.offsets[i + 1]]
+        dates = self.dates[(self.dates >= day[0]) & (self.dates <= self.last_day[i])]
+        values = size[np.searchsorted(day, dates, side="right") - 1]
+        return pd.DataFrame(
+            {
+                "Date": dates.astype("datetime64[D]").astype("datetime64[ns]"),
+                "Full_Global": name,
+                "SizeAllocated": values,
+            }
+        )
+
+
+# Sharded globals. A global never spans database paths, so rows are split by DataBasePath into shards with about
+# the same number of rows (biggest paths first, each to the smallest shard). Each shard is normalised, compacted to
+# change points and forecast in its own process, the results are small and are merged for the ranking, charts and pie.
+# shards is the number of processes, 0 is one per core, 1 runs in this process.
+
+
+def globals_shards(df_master_gb, shards):
+    rows = df_master_gb.groupby("DataBasePath", sort=False).size().sort_values(ascending=False)
+    shards = max(1, min(shards, len(rows)))
+    load = np.zeros(shards)
+    assign = {}
+    for path, count in rows.items():
+        assign[path] = int(load.argmin())
+        load[assign[path]] += count
+    shard = df_master_gb["DataBasePath"].map(assign).to_numpy()
+    return [df_master_gb[shard == i] for i in range(shards)]
+
+
+def globals_shard(df_shard, horizon_days):
+    paths = df_shard["DataBasePath"]
+    df_shard = add_full_global(df_shard)
+    df_shard["Date"] = to_dates(df_shard["Date"])
+    histories = GlobalHistories.from_frame(df_shard, paths)
+    df_forecast = forecast_growth(df_shard, "Full_Global", "SizeAllocated", horizon_days)
+    return histories, df_forecast
+
+
+def process_globals(df_master_gb, shards, horizon_days):
+    shards = (os.cpu_count() or 1) if shards == 0 else shards
+    if shards <= 1:
+        return globals_shard(df_master_gb, horizon_days)
+
+    parts = globals_shards(df_master_gb, shards)
+    with ProcessPoolExecutor(max_workers=len(parts)) as pool:
+        results = list(pool.map(globals_shard, parts, [horizon_days] * len(parts)))
+    return GlobalHistories.merge([r[0] for r in results]), pd.concat([r[1] for r in results])
+
+
+# Histories saved by the globals stage, one file per export and --since/--until window. Later stages and runs
+# load them rather than parse the export again, unless the export is newer.
+
+
+def histories_file(DIRECTORY, filename):
+    return DIRECTORY + "/all_globals/" + export_name(filename) + window_tag() + "_Histories.npz"
+
+
+def global_histories(DIRECTORY, filename):
+    save_as = histories_file(DIRECTORY, filename)
+    if os.path.exists(save_as) and os.path.getmtime(save_as) >= export_mtime(filename):
+        return GlobalHistories.load(save_as)
+    df_master_gb = read_monitor(filename, "globals", last=True).rename(columns={"RunDate": "Date"})
+    paths = df_master_gb["DataBasePath"]
+    histories = GlobalHistories.from_frame(add_full_global(df_master_gb), paths)
+    os.makedirs(DIRECTORY + "/all_globals", exist_ok=True)
+    histories.save(save_as)
+    return histories
+
+
+# Number of pixels across the figure, there is no point drawing more points than this
+
+
+def figure_pixel_width(fig=None):
+    if fig is None:
+        fig = plt.gcf()
+    return int(fig.get_figwidth() * fig.dpi)
+
+
+# Downsample long series before plotting. Split the points into pixel buckets and keep the
+# min and max of each bucket (plus first and last point) so peaks and dips stay visible.
+# Returns x, y unchanged if already short enough.
+
+
+def downsample_minmax(x, y, max_points):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if max_points < 4 or n <= max_points:
+        return x, y
+
+    buckets = max_points // 2
+    bucket = np.arange(n) * buckets // n  # Equal width buckets in point order, all non-empty
+    starts = np.searchsorted(bucket, np.arange(buckets))
+    ends = np.append(starts[1:], n) - 1
+
+    # Sort by bucket then value; first in each bucket is the min, last is the max. NaN never wins.
+    idx_min = np.lexsort((np.where(np.isnan(y), np.inf, y), bucket))[starts]
+    idx_max = np.lexsort((np.where(np.isnan(y), -np.inf, y), bucket))[ends]
+
+    keep = np.unique(np.concatenate(([0, n - 1], idx_min, idx_max)))
+    return x[keep], y[keep]
+
+
+# Plot a series on an axis, downsampled to the figure pixel width
+
+
+def plot_downsampled(ax, x, y, *args, **kwargs):
+    x, y = downsample_minmax(x, y, figure_pixel_width(ax.figure))
+    return ax.plot(x, y, *args, **kwargs)
+
+
+# Dense scatter as an image. Points are binned into a grid with numpy and the grid drawn with imshow, so drawing time
+# depends on the image size and not on the number of points (journal switches, page summary rows). Default grid is
+# the size of the axes in blocks of RASTER_PIXELS. Log axes are binned in log10 and labelled in real values, points
+# <= 0 can't be shown on a log axis and are dropped. Empty cells are left as background. Returns the image or None.
+RASTER_PIXELS = 4
+
+
+def raster_plot(
+    ax,
+    x,
+    y,
+    weights=None,
+    bins=None,
+    extent=None,
+    log_x=False,
+    log_y=False,
+    log_color=False,
+    cmap="viridis",
+    label="Count",
+):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = np.isfinite(x) & np.isfinite(y)
+    if log_x:
+        keep &= x > 0
+    if log_y:
+        keep &= y > 0
+    if not keep.any():
+        return None
+
+    x = np.log10(x[keep]) if log_x else x[keep]
+    y = np.log10(y[keep]) if log_y else y[keep]
+    if weights is not None:
+        weights = np.nan_to_num(np.asarray(weights, dtype=float)[keep])
+
+    if extent is None:
+        extent = [x.min(), x.max(), y.min(), y.max()]
+        for i in (0, 2):
+            if extent[i] == extent[i + 1]:  # Single value, give it some width
+                extent[i], extent[i + 1] = extent[i] - 0.5, extent[i + 1] + 0.5
+    if bins is None:
+        bbox = ax.get_window_extent()
+        bins = (max(int(bbox.width) // RASTER_PIXELS, 1), max(int(bbox.height) // RASTER_PIXELS, 1))
+
+    grid, _, _ = np.histogram2d(x, y, bins=bins, range=[extent[:2], extent[2:]], weights=weights)
+    grid = np.ma.masked_less_equal(grid.T, 0)
+
+    image = ax.imshow(
+        grid,
+        origin="lower",
+        extent=extent,
+        aspect="auto",
+        interpolation="nearest",
+        cmap=cmap,
+        norm=mpl.colors.LogNorm() if log_color else None,
+    )
+    ax.grid(False)
+    log_ticks = mpl.ticker.FuncFormatter(lambda v, pos: "{v:,g}".format(v=float("{v:.2g}".format(v=10**v))))
+    for axis, log in ((ax.xaxis, log_x), (ax.yaxis, log_y)):
+        if log:
+            axis.set_major_locator(mpl.ticker.MaxNLocator(8))
+            axis.set_major_formatter(log_ticks)
+    ax.figure.colorbar(image, ax=ax, label=label)
+    return image
 
 
 # Generic plot by date, single line, ticks on a Monday.
@@ -46,6 +1010,8 @@ def generic_plot(
     plot_text_string="",
     plot_hours=False,
 ):
+    if not DRAW_CHARTS:
+        return
     colormap_name = "Set1"
 
     plt.style.use("seaborn-whitegrid")
@@ -53,7 +1019,7 @@ def generic_plot(
     palette = plt.get_cmap(colormap_name)
     color = palette(1)
 
-    plt.plot(df[column], color=color, alpha=0.7)
+    plot_downsampled(plt.gca(), df.index.values, df[column].values, color=color, alpha=0.7)
     plt.title(title, fontsize=14)
     plt.ylabel(y_label, fontsize=10)
     plt.tick_params(labelsize=10)
@@ -85,11 +1051,13 @@ def generic_plot(
         fontsize=12,
     )
     plt.tight_layout()
-    plt.savefig(save_as, format="png")
+    save_figure(save_as, format="png")
     plt.close()
 
 
 def generic_top_n(df_sort, top_n, df_master_ps, plot_what, title, y_label, save_as, pres=False):
+    if not DRAW_CHARTS:
+        return
     colormapName = "Set1"
 
     top_List = df_sort["pName"].head(top_n).tolist()
@@ -105,7 +1073,7 @@ def generic_top_n(df_sort, top_n, df_master_ps, plot_what, title, y_label, save_
 
     for name, data in grpd:
         if name in top_List:
-            plt.plot(data.Date.values, data.eval(plot_what).values, "-", label=name)
+            plot_downsampled(plt.gca(), data.Date.values, data.eval(plot_what).values, "-", label=name)
     plt.title(title, fontsize=14)
     plt.ylabel(y_label, fontsize=10)
     plt.tick_params(labelsize=10)
@@ -120,41 +1088,497 @@ def generic_top_n(df_sort, top_n, df_master_ps, plot_what, title, y_label, save_
     ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
     plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
     plt.tight_layout()
-    plt.savefig(save_as, format="png")
+    save_figure(save_as, format="png")
     plt.close()
 
 
-# Dont crowd the pie chart. To do; bucket 'Other' after 2pct
+# Chart template for loops of near identical per-entity charts (eg top N globals or pages).
+# Figure, axes, formatters and locators are built once, each render() swaps in the new line data, title,
+# limits and text and saves. Optional second series on a twin y axis. close() when the loop is done.
+
+
+class ChartTemplate:
+    def __init__(self, y_label, twin_y_label=None, pres=False, twin_pres=True, color=None, twin_color="b"):
+        plt.style.use("seaborn-whitegrid")
+        self.fig, self.ax = plt.subplots(figsize=(16, 6), dpi=300)
+        if color is None:
+            color = plt.get_cmap("Set1")(1)
+
+        self.ax.xaxis_date()
+        (self.line,) = self.ax.plot([], [], color=color, alpha=0.7)
+        self.ax.grid(which="major", axis="both", linestyle="--")
+        self.ax.set_ylabel(y_label, fontsize=10, color=color if twin_y_label else "black")
+        self.ax.tick_params(labelsize=10)
+        self.ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.2f}" if pres else "{x:,.0f}"))
+        self.ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
+        self.text = self.ax.text(0.01, 0.95, "", ha="left", va="center", transform=self.ax.transAxes, fontsize=12)
+
+        self.ax2 = None
+        if twin_y_label is not None:
+            self.ax2 = self.ax.twinx()
+            (self.line2,) = self.ax2.plot([], [], color=twin_color)
+            self.ax2.set_ylabel(twin_y_label, fontsize=10, color=twin_color)
+            self.ax2.tick_params(labelsize=10)
+            self.ax2.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.2f}" if twin_pres else "{x:,.0f}"))
+            self.ax2.grid(None)
+
+    def render(self, title, save_as, x, y, y2=None, text=""):
+        width = figure_pixel_width(self.fig)
+        self.line.set_data(*downsample_minmax(x, y, width))
+        self._rescale(self.ax)
+        if self.ax2 is not None and y2 is not None:
+            self.line2.set_data(*downsample_minmax(x, y2, width))
+            self._rescale(self.ax2)
+
+        self.ax.set_title(title, fontsize=14)
+        self.text.set_text(text)
+        plt.setp(self.ax.get_xticklabels(), rotation=45, ha="right")
+        self.fig.tight_layout()
+        save_figure(save_as, fig=self.fig, format="png")
+
+    def close(self):
+        plt.close(self.fig)
+
+    @staticmethod
+    def _rescale(ax):
+        ax.set_autoscale_on(True)  # set_ylim turned it off on the previous render
+        ax.relim()
+        ax.autoscale_view()
+        ax.set_ylim(bottom=0)  # Always zero start
+
+
+# Dont crowd the pie chart. Keep the biggest PIE_TOP_N and bucket the rest as 'Other', so drawing time does not
+# depend on how many databases or globals there are. Labels only for slices over 2pct. Expects df sorted biggest first.
+PIE_TOP_N = 9
+
+
+def pie_slices(df_sorted, name_column, value_column, top_n=PIE_TOP_N):
+    df_pie = df_sorted[[name_column, value_column]].head(top_n)
+    other = df_sorted[value_column].iloc[top_n:].sum()
+    if other > 0:
+        df_pie = pd.concat(
+            [
+                df_pie,
+                pd.DataFrame({name_column: ["Other (" + str(len(df_sorted) - top_n) + ")"], value_column: [other]}),
+            ],
+            ignore_index=True,
+        )
+
+    total = df_pie[value_column].sum()
+    df_pie["Labels"] = np.where(df_pie[value_column] * 100 / total > 2, df_pie[name_column], "")
+    return df_pie
 
 
 def make_autopct(values):
+    total = sum(values)
+
     def my_autopct(pct):
-        total = sum(values)
         val = int(round(pct * total / 102400.0))
         return "{p:.0f}%  ({v:,d} GB)".format(p=pct, v=val) if pct > 2 else ""
 
     return my_autopct
 
 
-def average_episode_size(DIRECTORY, MonitorAppFile, MonitorDatabaseFile, TRAKDOCS, INCLUDE):
+# Dense dates x entity matrix of one value column, NaN where an entity has no row for a date.
+# Scatters straight into the matrix (quicker than pivot_table), duplicate rows for a date are summed.
+
+
+def dense_matrix(df, name_column, value_column):
+    date_codes, dates = pd.factorize(df["Date"], sort=True)
+    name_codes, names = pd.factorize(df[name_column], sort=True)
+    cells = date_codes * len(names) + name_codes
+    size = len(dates) * len(names)
+
+    counts = np.bincount(cells, minlength=size).reshape(len(dates), len(names))
+    sums = np.bincount(cells, weights=df[value_column].to_numpy(dtype=float), minlength=size)
+    Y = np.where(counts > 0, sums.reshape(len(dates), len(names)), np.nan)
+    return pd.DataFrame(Y, index=pd.DatetimeIndex(dates, name="Date"), columns=pd.Index(names, name=name_column))
+
+
+# Straight line growth forecast for every entity at once.
+# Pivot to a dense dates x entity matrix, missing days are NaN and carry no weight in the fit, then solve the
+# least squares normal equations for all columns together. Bands are ~95% prediction intervals at the horizon.
+# If a limit is given (same units as values, scalar or per entity) also estimate days until the limit is reached.
+
+
+def forecast_growth(df, name_column, value_column, horizon_days, limit=None):
+    matrix = dense_matrix(df, name_column, value_column)
+    Y = matrix.to_numpy()
+
+    t = ((matrix.index - matrix.index[0]) / pd.Timedelta(days=1)).to_numpy(dtype=float)[:, None]
+    W = ~np.isnan(Y)
+    Yw = np.where(W, Y, 0.0)
+    Tw = np.where(W, t, 0.0)
+
+    n = W.sum(axis=0).astype(float)
+    sum_t = Tw.sum(axis=0)
+    sum_y = Yw.sum(axis=0)
+    sum_tt = (Tw * Tw).sum(axis=0)
+    sum_ty = (Tw * Yw).sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_mean = sum_t / n
+        s_tt = sum_tt - n * t_mean**2
+        slope = np.where(s_tt > 0, (sum_ty - n * t_mean * (sum_y / n)) / s_tt, 0.0)
+        intercept = sum_y / n - slope * t_mean
+
+        residual = np.where(W, Y - (intercept + slope * t), 0.0)
+        ss_res = (residual**2).sum(axis=0)
+        ss_tot = (np.where(W, Y - sum_y / n, 0.0) ** 2).sum(axis=0)
+        r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan)
+        s2 = np.where(n > 2, ss_res / (n - 2), np.nan)
+
+        t_end = t[-1, 0]
+        t_horizon = t_end + horizon_days
+        fitted_end = intercept + slope * t_end
+        projected = intercept + slope * t_horizon
+        band = 1.96 * np.sqrt(s2 * (1 + 1 / n + (t_horizon - t_mean) ** 2 / np.where(s_tt > 0, s_tt, np.nan)))
+
+        last = matrix.ffill().iloc[-1].to_numpy(dtype=float)
+        first = matrix.bfill().iloc[0].to_numpy(dtype=float)
+
+    df_forecast = pd.DataFrame(
+        {
+            "Days": n.astype(int),
+            "Start": first,
+            "End": last,
+            "Growth/Day": slope,
+            "Growth/Year": slope * 365,
+            "R2": r2,
+            "Fitted End": fitted_end,
+            "Projected": projected,
+            "Lower": projected - band,
+            "Upper": projected + band,
+        },
+        index=matrix.columns,
+    )
+    df_forecast.index.name = name_column
+
+    if limit is not None:
+        if isinstance(limit, pd.Series):
+            limit = limit.reindex(matrix.columns).to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            days = (np.asarray(limit, dtype=float) - last) / slope
+        df_forecast["Limit"] = limit
+        df_forecast["Days Until Limit"] = np.where((slope > 0) & (days >= 0), days, np.nan)
+
+    return df_forecast
+
+
+# Dashed projection and band for each line on the chart that has a forecast, same colour as the line
+
+
+def plot_forecast_overlay(ax, df_forecast, end_date, horizon_days, scale=1.0):
+    x = [end_date, end_date + pd.Timedelta(days=horizon_days)]
+    for line in list(ax.get_lines()):
+        name = line.get_label()
+        if name not in df_forecast.index:
+            continue
+        row = df_forecast.loc[name]
+        color = line.get_color()
+        ax.plot(x, [row["Fitted End"] * scale, row["Projected"] * scale], "--", color=color, alpha=0.8)
+        if np.isfinite(row["Lower"]) and np.isfinite(row["Upper"]):
+            ax.fill_between(
+                x,
+                [row["Fitted End"] * scale, row["Lower"] * scale],
+                [row["Fitted End"] * scale, row["Upper"] * scale],
+                color=color,
+                alpha=0.1,
+                linewidth=0,
+            )
+
+
+# Dates x pName matrix of one metric. Per hit ratios are inf on days with no hits, those days are missing rather
+# than anomalies.
+
+
+def anomaly_matrix(df_master_ps, metric):
+    matrix = dense_matrix(df_master_ps, "pName", metric)
+    return matrix.where(np.isfinite(matrix))
+
+
+# Anomalies in page summary metrics, all pages at once.
+# For each metric build the dates x pName matrix, baseline is the rolling median of the previous `window` days
+# and scale is the rolling median absolute deviation (floored so flat pages don't divide by zero).
+# Returns one row per day/page/metric with abs(robust z) >= threshold, worst first.
+
+
+def anomaly_baseline(matrix, window):
+    return matrix.rolling(window, min_periods=max(3, window // 2)).median().shift(1)
+
+
+def page_anomalies(df_master_ps, metrics, window=14, threshold=3.5):
+    min_periods = max(3, window // 2)
+    results = []
+    for metric in metrics:
+        matrix = anomaly_matrix(df_master_ps, metric)
+
+        baseline = anomaly_baseline(matrix, window)
+        deviation = (matrix - baseline).abs()
+        mad = deviation.rolling(window, min_periods=min_periods).median().shift(1)
+
+        # 1.4826 * MAD estimates the standard deviation, so z is comparable to a normal z score
+        scale = np.maximum(1.4826 * mad, 0.01 * baseline.abs())
+        z = (matrix - baseline) / scale.where(scale > 0)
+
+        mask = np.isfinite(z.to_numpy()) & (z.abs().to_numpy() >= threshold)
+        rows, cols = np.nonzero(mask)
+        results.append(
+            pd.DataFrame(
+                {
+                    "Date": matrix.index[rows],
+                    "pName": matrix.columns[cols],
+                    "Metric": metric,
+                    "Value": matrix.to_numpy()[rows, cols],
+                    "Baseline": baseline.to_numpy()[rows, cols],
+                    "Robust Z": z.to_numpy()[rows, cols],
+                }
+            )
+        )
+
+    df_anomalies = pd.concat(results, ignore_index=True)
+    return df_anomalies.reindex(df_anomalies["Robust Z"].abs().sort_values(ascending=False).index)
+
+
+# Small multiples of the worst anomalies, each page/metric series with its baseline and anomaly days marked.
+# Series and baseline come from the same dates x pName matrix as page_anomalies(), days a page is missing are gaps.
+
+
+def plot_anomalies(df_master_ps, df_anomalies, top_n, window, title, save_as):
+    df_worst = df_anomalies.drop_duplicates(subset=["pName", "Metric"]).head(top_n)
+    if not DRAW_CHARTS or df_worst.empty:
+        return
+
+    columns = 3
+    rows = int(np.ceil(len(df_worst) / columns))
+    plt.style.use("seaborn-whitegrid")
+    fig, axes = plt.subplots(rows, columns, figsize=(16, 4 * rows), dpi=300, squeeze=False)
+
+    matrices = {metric: anomaly_matrix(df_master_ps, metric) for metric in df_worst["Metric"].unique()}
+    for ax, (_, worst) in zip(axes.flat, df_worst.iterrows()):
+        series = matrices[worst["Metric"]][worst["pName"]]
+        baseline = anomaly_baseline(series, window)
+        df_page = series.dropna()
+        df_marks = df_anomalies[(df_anomalies["pName"] == worst["pName"]) & (df_anomalies["Metric"] == worst["Metric"])]
+
+        plot_downsampled(ax, df_page.index.values, df_page.values, color="b", alpha=0.7)
+        ax.plot(baseline.index.values, baseline.values, "--", color="g", alpha=0.7)
+        ax.plot(df_marks["Date"].values, df_marks["Value"].values, "o", color="r")
+        ax.set_title(worst["pName"] + "\n" + worst["Metric"], fontsize=10)
+        ax.tick_params(labelsize=8)
+        ax.set_ylim(bottom=0)  # Always zero start
+        ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+        plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+
+    for ax in axes.flat[len(df_worst) :]:
+        ax.set_visible(False)
+
+    fig.suptitle(title, fontsize=14)
+    fig.tight_layout()
+    save_figure(save_as, fig=fig, format="png")
+    plt.close(fig)
+
+
+# Daily Top N. Whole period rankings hide a page or global that was top for only a few days. Rank every day on its
+# own: sort by date then value and keep the first top_n rows of each date, no loop over days. Writes a summary of
+# each name that was ever in the daily top N (days in top N, days at 1, best and mean rank), the rank of each name
+# by day (blank when out of the top N) and a bump chart. Ties are in name order. Duplicate rows for a name on a
+# date are summed first, as in dense_matrix().
+RANK_CHART_LINES = 10  # Names coloured in the bump chart, the rest are grey
+
+
+def daily_ranks(df, name_column, value_column, top_n):
+    df_ranks = df.dropna(subset=[value_column]).groupby(["Date", name_column], as_index=False)[value_column].sum()
+    df_ranks = df_ranks.sort_values(by=["Date", value_column, name_column], ascending=[True, False, True])
+    df_ranks = df_ranks.groupby("Date", sort=False).head(top_n).copy()
+    df_ranks["Rank"] = df_ranks.groupby("Date", sort=False).cumcount() + 1
+    return df_ranks
+
+
+def rank_tracking(df, name_column, value_column, top_n, label, outputFile_csv, outputFile_png, TITLEDATES):
+    df_ranks = daily_ranks(df, name_column, value_column, top_n)
+    if df_ranks.empty:
+        return
+
+    df_ranks["At 1"] = df_ranks["Rank"] == 1
+    in_top = "Days In Top " + str(top_n)
+    df_summary = df_ranks.groupby(name_column).agg(
+        **{
+            in_top: ("Rank", "size"),
+            "Days At 1": ("At 1", "sum"),
+            "Best Rank": ("Rank", "min"),
+            "Mean Rank": ("Rank", "mean"),
+            "First Day": ("Date", "min"),
+            "Last Day": ("Date", "max"),
+        }
+    )
+    df_summary = df_summary.sort_values(by=["Days At 1", in_top, "Mean Rank"], ascending=[False, False, True])
+    write_csv(df_summary, outputFile_csv + "_Daily_Top_" + str(top_n) + "_" + label + ".csv", sep=",")
+
+    df_rank_table = df_ranks.pivot(index="Date", columns=name_column, values="Rank")[df_summary.index].astype("Int64")
+    write_csv(df_rank_table, outputFile_csv + "_Daily_Rank_" + label + ".csv", sep=",")
+
+    plot_bump(
+        df_rank_table,
+        top_n,
+        "Daily Top " + str(top_n) + " Rank - " + label + "  " + TITLEDATES,
+        outputFile_png + "_Daily_Rank_" + label + ".png",
+    )
+
+
+# Rank by day, a line for each name, gaps when out of the top N. Columns are in order of importance.
+
+
+def plot_bump(df_rank_table, top_n, title, save_as):
+    if not DRAW_CHARTS:
+        return
+
+    plt.style.use("seaborn-whitegrid")
+    plt.figure(num=None, figsize=(16, 6), dpi=300)
+    ax = plt.gca()
+    dates = df_rank_table.index.values
+
+    others = df_rank_table.columns[RANK_CHART_LINES:]
+    if len(others) > 0:
+        ax.plot(
+            dates, df_rank_table[others].to_numpy(dtype=float, na_value=np.nan), "-", color="lightgrey", linewidth=0.8
+        )
+    palette = plt.get_cmap("tab10")
+    for i, name in enumerate(df_rank_table.columns[:RANK_CHART_LINES]):
+        ax.plot(
+            dates,
+            df_rank_table[name].to_numpy(dtype=float, na_value=np.nan),
+            "-o",
+            color=palette(i % 10),
+            markersize=3,
+            label=name,
+        )
+
+    ax.set_ylim(top_n + 0.5, 0.5)  # Rank 1 at the top
+    ax.set_yticks(range(1, top_n + 1))
+    plt.title(title, fontsize=14)
+    plt.ylabel("Rank", fontsize=10)
+    plt.tick_params(labelsize=10)
+    plt.legend(loc="upper left", bbox_to_anchor=(1.01, 1), fontsize=8)
+    ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+    plt.tight_layout()
+    save_figure(save_as, format="png")
+    plt.close()
+
+
+# Journal write rates. Each journal file is written from its create time until the next one is created, so its
+# size over that interval is the write rate. Hourly totals (by create hour) over the whole history give the
+# peaks and the day x hour heatmap. df_master is the deduplicated journals indexed by create date.
+
+
+def journal_analytics(df_master, outputFile_csv, outputFile_png, TITLEDATES):
+    created = df_master.index.to_numpy()
+    seconds = np.diff(created).astype("timedelta64[ms]").astype(float) / 1000
+    interval = np.r_[seconds, np.nan]  # Last journal is still open
+    size_mb = df_master["Size"].to_numpy(dtype=float) / (1024 * 1024)
+
+    df_rates = pd.DataFrame(
+        {
+            "Size MB": size_mb,
+            "Interval s": interval,
+            "MB/s": size_mb / np.where(interval > 0, interval, np.nan),
+            "Reason": df_master["Reason"].to_numpy(),
+        },
+        index=df_master.index.rename("Create Date"),
+    )
+    write_csv(df_rates, outputFile_csv + "_Switch_Intervals.csv", sep=",")
+
+    # MB written in each hour of the history, dates x hour of day
+    hour = df_master.index.floor("h")
+    date_codes, dates = pd.factorize(hour.normalize(), sort=True)
+    cells = date_codes * 24 + hour.hour.to_numpy()
+    hourly = np.bincount(cells, weights=size_mb, minlength=len(dates) * 24).reshape(len(dates), 24)
+    df_hourly = pd.DataFrame(hourly, index=pd.Index(pd.DatetimeIndex(dates).date, name="Date"), columns=range(24))
+    write_csv(df_hourly, outputFile_csv + "_Hourly_MB.csv", sep=",")
+
+    # Distributions - switch interval, write rate per journal, MB per hour
+    quantiles = [0.5, 0.9, 0.95, 0.99]
+    df_percentiles = pd.DataFrame(
+        {
+            "Interval s": df_rates["Interval s"].quantile(quantiles),
+            "MB/s": df_rates["MB/s"].quantile(quantiles),
+            "MB/hour": pd.Series(hourly.ravel()).quantile(quantiles),
+        }
+    )
+    df_percentiles.index = ["p50", "p90", "p95", "p99"]
+    df_percentiles.loc["max"] = [df_rates["Interval s"].max(), df_rates["MB/s"].max(), hourly.max()]
+    df_percentiles.loc["min"] = [df_rates["Interval s"].min(), df_rates["MB/s"].min(), hourly.min()]
+    write_csv(df_percentiles, outputFile_csv + "_Write_Rate_Percentiles.csv", sep=",", index_label="Percentile")
+
+    # Peak hour of day across the whole history
+    df_peaks = pd.DataFrame(
+        {
+            "Mean MB": hourly.mean(axis=0),
+            "p95 MB": np.percentile(hourly, 95, axis=0),
+            "Peak MB": hourly.max(axis=0),
+            "Peak MB/s": hourly.max(axis=0) / 3600,
+        },
+        index=pd.Index(range(24), name="Hour"),
+    )
+    write_csv(df_peaks, outputFile_csv + "_Hourly_Peaks.csv", sep=",")
+
+    if not DRAW_CHARTS:
+        return
+
+    TextString = (
+        "Write rate p95 : "
+        + "{v:,.1f}".format(v=df_percentiles.loc["p95", "MB/s"])
+        + " MB/s, p99 : "
+        + "{v:,.1f}".format(v=df_percentiles.loc["p99", "MB/s"])
+        + " MB/s, peak hour : "
+        + "{v:,.0f}".format(v=hourly.max())
+        + " MB"
+    )
+    # One cell per day and hour from the first to the last day, midnight at the bottom
+    first_day = dates[0]
+    days = (dates[-1] - first_day).days + 1
+    x_from = mdates.date2num(first_day)
+    plt.figure(num=None, figsize=(16, 6), dpi=300)
+    ax = plt.gca()
+    raster_plot(
+        ax,
+        mdates.date2num(df_master.index),
+        df_master.index.hour + df_master.index.minute / 60,
+        weights=size_mb,
+        bins=(days, 24),
+        extent=[x_from, x_from + days, 0, 24],
+        cmap="rocket_r",
+        label="MB written",
+    )
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y-%m-%d"))
+    plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+    plt.yticks(range(0, 25, 3), fontsize=8)
+    plt.title("Journal MB Written by Day and Hour  " + TITLEDATES + "\n" + TextString, fontsize=14)
+    plt.ylabel("Hour of day", fontsize=10)
+    plt.xlabel("")
+    plt.tight_layout()
+    save_figure(outputFile_png + "_Day_Hour_Heatmap.png", format="png")
+    plt.close()
+
+
+def average_episode_size(DIRECTORY, MonitorAppFile, MonitorDatabaseFile, TRAKDOCS, INCLUDE, stats):
     logger = logging.getLogger(__name__)
     colormapName = "Set1"
 
     # Get the episode data
-    outputName = os.path.splitext(os.path.basename(MonitorDatabaseFile))[0]
+    outputName = export_name(MonitorDatabaseFile)
     outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_Summary"
     outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName + "_Summary"
     print("Episode size: %s" % outputName)
 
-    df_master_ep = pd.read_csv(MonitorAppFile, sep="\t", encoding="ISO-8859-1")
+    df_master_ep = read_monitor(MonitorAppFile, "episode_size_app")
 
-    # EpisodeCountEmergency column is empty() in some versions of TC
-    emergency_empty = False
-    if pd.isna(df_master_ep["EpisodeCountEmergency"]).all():
-        emergency_empty = True
-    lab_empty = False
-    if pd.isna(df_master_ep["LabEpisodeCountTotal"]).all():
-        lab_empty = True
+    # EpisodeCountEmergency column is empty() or missing in some versions of TC, the export layout
+    # leaves it out if so. It can also be blank for just the --since/--until window.
+    emergency_empty = "EpisodeCountEmergency" not in df_master_ep or df_master_ep["EpisodeCountEmergency"].isna().all()
+    lab_empty = "LabEpisodeCountTotal" not in df_master_ep or df_master_ep["LabEpisodeCountTotal"].isna().all()
 
     df_master_ep = df_master_ep.dropna(axis=1, how="all")
     df_master_ep = df_master_ep.rename(columns={"RunDate": "Date"})
@@ -173,7 +1597,7 @@ def average_episode_size(DIRECTORY, MonitorAppFile, MonitorDatabaseFile, TRAKDOC
 
     # print(f"\nDatabase\n{df_master_ep}")
     # Get the database growth data
-    df_master_db = pd.read_csv(MonitorDatabaseFile, sep="\t", encoding="ISO-8859-1")
+    df_master_db = read_monitor(MonitorDatabaseFile, "episode_size_db")
     df_master_db = df_master_db.dropna(axis=1, how="all")
     df_master_db = df_master_db.rename(columns={"RunDate": "Date"})
 
@@ -181,7 +1605,8 @@ def average_episode_size(DIRECTORY, MonitorAppFile, MonitorDatabaseFile, TRAKDOC
     df_master_db["DatabaseUsedMB"] = df_master_db["SizeinMB"] - df_master_db["FreeSpace"]
     df_master_db = df_master_db[["Date", "DatabaseUsedMB", "Name"]]
 
-    df_master_db.to_csv(outputFile_csv + "Database_With_Docs.csv", sep=",", index=False)
+    if TRAKDOCS == ["all"]:
+        write_csv(df_master_db, outputFile_csv + "Database_With_Docs.csv", sep=",", index=False)
 
     # Always exclude CACHETEMP
     df_master_db = df_master_db[df_master_db.Name != "CACHETEMP"]
@@ -213,11 +1638,11 @@ def average_episode_size(DIRECTORY, MonitorAppFile, MonitorDatabaseFile, TRAKDOC
     # Merge episodes and database growth on date, create column for daily plot
     df_result = pd.merge(df_master_ep, df_db_by_date)
     df_result["AvgEpisodeSizeMB"] = df_result["DatabaseGrowthMB"] / df_result["EpisodeCountTotal"]
-    df_result["Date"] = pd.to_datetime(df_result["Date"])
+    df_result["Date"] = to_dates(df_result["Date"])
     df_result.set_index("Date", inplace=True)
 
     if TRAKDOCS == ["all"]:
-        df_result.to_csv(outputFile_csv + "Database_Growth.csv", sep=",", index=True)
+        write_csv(df_result, outputFile_csv + "Database_Growth.csv", sep=",", index=True)
 
     # Build the plot
     # print(f"\nDatabase\n{df_result}")
@@ -232,284 +1657,762 @@ def average_episode_size(DIRECTORY, MonitorAppFile, MonitorDatabaseFile, TRAKDOC
     RunDateEnd = df_result.tail(1).index.tolist()
     RunDateEnd = RunDateEnd[0].strftime("%d/%m/%Y")
 
-    plt.style.use("seaborn-whitegrid")
-    plt.figure(num=None, figsize=(16, 6), dpi=300)
-    palette = plt.get_cmap(colormapName)
-    color = palette(1)
+    if DRAW_CHARTS:
+        plt.style.use("seaborn-whitegrid")
+        plt.figure(num=None, figsize=(16, 6), dpi=300)
+        palette = plt.get_cmap(colormapName)
+        color = palette(1)
 
-    plt.plot(df_result["AvgEpisodeSizeMB"])
-    plt.title("Average Episode Size " + RunDateStart + " - " + RunDateEnd, fontsize=14)
-    plt.tick_params(labelsize=10)
-    ax = plt.gca()
-    ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.2f}"))
-    ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
-    ax.xaxis.set_major_formatter(mdates.DateFormatter("%d/%m/%y - %H:%M"))
-    plt.ylabel("Average episode size (MB)", fontsize=10)
-    plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
-    plt.text(
-        0.01,
-        0.95,
-        TextString,
-        ha="left",
-        va="center",
-        transform=ax.transAxes,
-        fontsize=12,
-    )
-    plt.tight_layout()
-    plt.savefig(outputFile_png_x, format="png")
-    # plt.show()
-    plt.close()
+        plot_downsampled(plt.gca(), df_result.index.values, df_result["AvgEpisodeSizeMB"].values)
+        plt.title("Average Episode Size " + RunDateStart + " - " + RunDateEnd, fontsize=14)
+        plt.tick_params(labelsize=10)
+        ax = plt.gca()
+        ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.2f}"))
+        ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%d/%m/%y - %H:%M"))
+        plt.ylabel("Average episode size (MB)", fontsize=10)
+        plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+        plt.text(
+            0.01,
+            0.95,
+            TextString,
+            ha="left",
+            va="center",
+            transform=ax.transAxes,
+            fontsize=12,
+        )
+        plt.tight_layout()
+        save_figure(outputFile_png_x, format="png")
+        # plt.show()
+        plt.close()
 
-    # Print some useful stats to txt file
+    # Print some useful stats to txt file, every pass adds to stats and mainline writes them out once
     # Note on individual days there will be rounding errors of MBs
     #          - for totals use start and end figures where possible, eg end-start not growth_column.sum()
 
     # print(f"\n\nResults: {df_result}")
 
     if TRAKDOCS == ["all"]:
-        with open(DIRECTORY + "/all_" + outputName + "_Basic_Stats.txt", "w") as f:
-            f.write(
-                "Number of days data            : " + "{v:,.0f}".format(v=df_result["DatabaseUsedMB"].count()) + "\n"
-            )
-            f.write(
-                "Database size at start         : "
-                + "{v:,.0f}".format(v=df_result.iloc[0]["DatabaseUsedMB"] / 1024)
-                + " GB\n"
-            )
-            f.write(
-                "Database size at end           : "
-                + "{v:,.0f}".format(v=df_result.iloc[-1]["DatabaseUsedMB"] / 1024)
-                + " GB\n"
-            )
-
-            f.write("\nTotal database growth          : " + "{v:,.3f}".format(v=DatabaseGrowthTotal / 1024) + " GB\n")
-            f.write(
-                "Peak database growth/day       : "
-                + "{v:,.3f}".format(v=df_result["DatabaseGrowthMB"].max() / 1024)
-                + " GB\n"
-            )
-            f.write(
-                "Average database growth/day    : "
-                + "{v:,.3f}".format(v=(DatabaseGrowthTotal / 1024) / df_result["DatabaseGrowthMB"].count())
-                + " GB\n"
-            )
-            f.write(
-                "Estimated database growth/year : "
-                + "{v:,.0f}".format(v=((DatabaseGrowthTotal / 1024) / df_result["DatabaseGrowthMB"].count()) * 365)
-                + " GB\n\n"
-            )
+        stats.write(
+            "Number of days data            : " + "{v:,.0f}".format(v=df_result["DatabaseUsedMB"].count()) + "\n"
+        )
+        stats.write(
+            "Database size at start         : "
+            + "{v:,.0f}".format(v=df_result.iloc[0]["DatabaseUsedMB"] / 1024)
+            + " GB\n"
+        )
+        stats.write(
+            "Database size at end           : "
+            + "{v:,.0f}".format(v=df_result.iloc[-1]["DatabaseUsedMB"] / 1024)
+            + " GB\n"
+        )
 
-            f.write(
-                "Sum episodes                   : " + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].sum()) + "\n"
-            )
-            f.write(
-                "Average episodes/day           : " + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].mean()) + "\n"
-            )
-            f.write(
-                "Peak episodes/day              : " + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].max()) + "\n"
-            )
-            f.write(
-                "Estimated episodes/year        : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].mean() * 365)
-                + "\n\n"
-            )
+        stats.write("\nTotal database growth          : " + "{v:,.3f}".format(v=DatabaseGrowthTotal / 1024) + " GB\n")
+        stats.write(
+            "Peak database growth/day       : "
+            + "{v:,.3f}".format(v=df_result["DatabaseGrowthMB"].max() / 1024)
+            + " GB\n"
+        )
+        stats.write(
+            "Average database growth/day    : "
+            + "{v:,.3f}".format(v=(DatabaseGrowthTotal / 1024) / df_result["DatabaseGrowthMB"].count())
+            + " GB\n"
+        )
+        stats.write(
+            "Estimated database growth/year : "
+            + "{v:,.0f}".format(v=((DatabaseGrowthTotal / 1024) / df_result["DatabaseGrowthMB"].count()) * 365)
+            + " GB\n\n"
+        )
 
-            # Emergency
-            if not emergency_empty:
-                f.write(
-                    "Sum Emergency episodes                   : "
-                    + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].sum())
-                    + "\n"
-                )
-                f.write(
-                    "Average Emergency episodes/day           : "
-                    + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].mean())
-                    + "\n"
-                )
-                f.write(
-                    "Peak Emergency episodes/day              : "
-                    + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].max())
-                    + "\n"
-                )
-                f.write(
-                    "Estimated Emergency episodes/year        : "
-                    + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].mean() * 365)
-                    + "\n\n"
-                )
+        stats.write(
+            "Sum episodes                   : " + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].sum()) + "\n"
+        )
+        stats.write(
+            "Average episodes/day           : " + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].mean()) + "\n"
+        )
+        stats.write(
+            "Peak episodes/day              : " + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].max()) + "\n"
+        )
+        stats.write(
+            "Estimated episodes/year        : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountTotal"].mean() * 365)
+            + "\n\n"
+        )
 
-            # Inpatient
-            f.write(
-                "Sum Inpatient episodes                   : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].sum())
+        # Emergency
+        if not emergency_empty:
+            stats.write(
+                "Sum Emergency episodes                   : "
+                + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].sum())
                 + "\n"
             )
-            f.write(
-                "Average Inpatient episodes/day           : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].mean())
+            stats.write(
+                "Average Emergency episodes/day           : "
+                + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].mean())
                 + "\n"
             )
-            f.write(
-                "Peak Inpatient episodes/day              : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].max())
+            stats.write(
+                "Peak Emergency episodes/day              : "
+                + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].max())
                 + "\n"
             )
-            f.write(
-                "Estimated Inpatient episodes/year        : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].mean() * 365)
+            stats.write(
+                "Estimated Emergency episodes/year        : "
+                + "{v:,.0f}".format(v=df_result["EpisodeCountEmergency"].mean() * 365)
                 + "\n\n"
             )
-            # Outpatient
-            f.write(
-                "Sum Outpatient episodes                   : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].sum())
+
+        # Inpatient
+        stats.write(
+            "Sum Inpatient episodes                   : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].sum())
+            + "\n"
+        )
+        stats.write(
+            "Average Inpatient episodes/day           : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].mean())
+            + "\n"
+        )
+        stats.write(
+            "Peak Inpatient episodes/day              : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].max())
+            + "\n"
+        )
+        stats.write(
+            "Estimated Inpatient episodes/year        : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountInpatient"].mean() * 365)
+            + "\n\n"
+        )
+        # Outpatient
+        stats.write(
+            "Sum Outpatient episodes                   : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].sum())
+            + "\n"
+        )
+        stats.write(
+            "Average Outpatient episodes/day           : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].mean())
+            + "\n"
+        )
+        stats.write(
+            "Peak Outpatient episodes/day              : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].max())
+            + "\n"
+        )
+        stats.write(
+            "Estimated Outpatient episodes/year        : "
+            + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].mean() * 365)
+            + "\n\n"
+        )
+
+        # # Lab
+        if not lab_empty:
+            stats.write(
+                "Sum Lab episodes                          : "
+                + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].sum())
                 + "\n"
             )
-            f.write(
-                "Average Outpatient episodes/day           : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].mean())
+            stats.write(
+                "Average Lab episodes/day                  : "
+                + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].mean())
                 + "\n"
             )
-            f.write(
-                "Peak Outpatient episodes/day              : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].max())
+            stats.write(
+                "Peak Lab episodes/day                     : "
+                + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].max())
                 + "\n"
             )
-            f.write(
-                "Estimated Outpatient episodes/year        : "
-                + "{v:,.0f}".format(v=df_result["EpisodeCountOutpatient"].mean() * 365)
+            stats.write(
+                "Estimated Lab episodes/year               : "
+                + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].mean() * 365)
                 + "\n\n"
             )
 
-            # # Lab
-            if not lab_empty:
-                f.write(
-                    "Sum Lab episodes                          : "
-                    + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].sum())
-                    + "\n"
-                )
-                f.write(
-                    "Average Lab episodes/day                  : "
-                    + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].mean())
-                    + "\n"
-                )
-                f.write(
-                    "Peak Lab episodes/day                     : "
-                    + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].max())
-                    + "\n"
-                )
-                f.write(
-                    "Estimated Lab episodes/year               : "
-                    + "{v:,.0f}".format(v=df_result["LabEpisodeCountTotal"].mean() * 365)
-                    + "\n\n"
-                )
-
-            f.write(
-                "Total database growth{0}{1} databases: {2:,.3f}".format(
-                    includew, ", ".join(TRAKDOCS), DatabaseGrowthTotal / 1024
-                )
-                + " GB\n"
+        stats.write(
+            "Total database growth{0}{1} databases: {2:,.3f}".format(
+                includew, ", ".join(TRAKDOCS), DatabaseGrowthTotal / 1024
             )
-            f.write(
-                "Average growth/episode{0}{1} databases: {2:,.0f} KB (per episode size)".format(
-                    includew, ", ".join(TRAKDOCS), AverageEpisodeSize * 1024
-                )
-                + "\n"
+            + " GB\n"
+        )
+        stats.write(
+            "Average growth/episode{0}{1} databases: {2:,.0f} KB (per episode size)".format(
+                includew, ", ".join(TRAKDOCS), AverageEpisodeSize * 1024
             )
+            + "\n"
+        )
 
-            TextString = (
-                "Database size at end : " + "{v:,.0f}".format(v=df_result.iloc[-1]["DatabaseUsedMB"] / 1024) + " GB\n"
-            )
-            generic_plot(
-                df_result,
-                "DatabaseUsedMB",
-                "Total Database Size (MB)  " + RunDateStart + " to " + RunDateEnd,
-                "MB",
-                outputFile_png + "_All_Total.png",
-                False,
-                True,
-                TextString,
-            )
-            TextString = (
-                "Average database growth/day : "
-                + "{v:,.3f}".format(v=DatabaseGrowthTotal / 1024 / df_result["DatabaseGrowthMB"].count())
-                + " GB"
-            )
-            generic_plot(
-                df_result,
-                "DatabaseGrowthMB",
-                "Database Growth per Day (MB)  " + RunDateStart + " to " + RunDateEnd,
-                "MB",
-                outputFile_png + "_All_Growth.png",
-                False,
-                False,
-                TextString,
-            )
+        TextString = (
+            "Database size at end : " + "{v:,.0f}".format(v=df_result.iloc[-1]["DatabaseUsedMB"] / 1024) + " GB\n"
+        )
+        generic_plot(
+            df_result,
+            "DatabaseUsedMB",
+            "Total Database Size (MB)  " + RunDateStart + " to " + RunDateEnd,
+            "MB",
+            outputFile_png + "_All_Total.png",
+            False,
+            True,
+            TextString,
+        )
+        TextString = (
+            "Average database growth/day : "
+            + "{v:,.3f}".format(v=DatabaseGrowthTotal / 1024 / df_result["DatabaseGrowthMB"].count())
+            + " GB"
+        )
+        generic_plot(
+            df_result,
+            "DatabaseGrowthMB",
+            "Database Growth per Day (MB)  " + RunDateStart + " to " + RunDateEnd,
+            "MB",
+            outputFile_png + "_All_Growth.png",
+            False,
+            False,
+            TextString,
+        )
     else:
-        with open(DIRECTORY + "/all_" + outputName + "_Basic_Stats.txt", "a") as f:
-            f.write(
-                "\nTotal database growth{0}{1}: {2:,.2f}".format(
-                    includew, ", ".join(TRAKDOCS), DatabaseGrowthTotal / 1024
-                )
-                + " GB\n"
-            )
-            f.write(
-                "Average growth/episode{0}{1}: {2:,.0f} KB (per episode size)".format(
-                    includew, ", ".join(TRAKDOCS), AverageEpisodeSize * 1024
-                )
-                + "\n"
+        stats.write(
+            "\nTotal database growth{0}{1}: {2:,.2f}".format(includew, ", ".join(TRAKDOCS), DatabaseGrowthTotal / 1024)
+            + " GB\n"
+        )
+        stats.write(
+            "Average growth/episode{0}{1}: {2:,.0f} KB (per episode size)".format(
+                includew, ", ".join(TRAKDOCS), AverageEpisodeSize * 1024
             )
+            + "\n"
+        )
 
-            ChartTitle = (
-                "Total Database Size (MB)" + includew + ", ".join(TRAKDOCS) + " " + RunDateStart + " to " + RunDateEnd
-            )
-            if INCLUDE:
-                outputFile_png_y = outputFile_png + "_" + "_".join(TRAKDOCS) + "_Total.png"
-            else:
-                outputFile_png_y = outputFile_png + "_Not_" + "_".join(TRAKDOCS) + "_Total.png"
-            TextString = (
-                "Database size at end : " + "{v:,.0f}".format(v=df_result.iloc[-1]["DatabaseUsedMB"] / 1024) + " GB"
-            )
-            generic_plot(
-                df_result,
-                "DatabaseUsedMB",
-                ChartTitle,
-                "MB",
-                outputFile_png_y,
-                False,
-                True,
-                TextString,
-            )
+        ChartTitle = (
+            "Total Database Size (MB)" + includew + ", ".join(TRAKDOCS) + " " + RunDateStart + " to " + RunDateEnd
+        )
+        if INCLUDE:
+            outputFile_png_y = outputFile_png + "_" + "_".join(TRAKDOCS) + "_Total.png"
+        else:
+            outputFile_png_y = outputFile_png + "_Not_" + "_".join(TRAKDOCS) + "_Total.png"
+        TextString = (
+            "Database size at end : " + "{v:,.0f}".format(v=df_result.iloc[-1]["DatabaseUsedMB"] / 1024) + " GB"
+        )
+        generic_plot(
+            df_result,
+            "DatabaseUsedMB",
+            ChartTitle,
+            "MB",
+            outputFile_png_y,
+            False,
+            True,
+            TextString,
+        )
 
-            ChartTitle = (
-                "Database Growth per Day" + includew + ", ".join(TRAKDOCS) + " " + RunDateStart + " to " + RunDateEnd
-            )
-            if INCLUDE:
-                outputFile_png_y = outputFile_png + "_" + "_".join(TRAKDOCS) + "_Growth.png"
-            else:
-                outputFile_png_y = outputFile_png + "_Not_" + "_".join(TRAKDOCS) + "_Growth.png"
-            TextString = (
-                "Average database growth/day : "
-                + "{v:,.3f}".format(v=DatabaseGrowthTotal / 1024 / df_result["DatabaseGrowthMB"].count())
-                + " GB"
-            )
-            generic_plot(
-                df_result,
-                "DatabaseGrowthMB",
-                ChartTitle,
-                "MB",
-                outputFile_png_y,
-                False,
-                False,
-                TextString,
-            )
+        ChartTitle = (
+            "Database Growth per Day" + includew + ", ".join(TRAKDOCS) + " " + RunDateStart + " to " + RunDateEnd
+        )
+        if INCLUDE:
+            outputFile_png_y = outputFile_png + "_" + "_".join(TRAKDOCS) + "_Growth.png"
+        else:
+            outputFile_png_y = outputFile_png + "_Not_" + "_".join(TRAKDOCS) + "_Growth.png"
+        TextString = (
+            "Average database growth/day : "
+            + "{v:,.3f}".format(v=DatabaseGrowthTotal / 1024 / df_result["DatabaseGrowthMB"].count())
+            + " GB"
+        )
+        generic_plot(
+            df_result,
+            "DatabaseGrowthMB",
+            ChartTitle,
+            "MB",
+            outputFile_png_y,
+            False,
+            False,
+            TextString,
+        )
+
+    # Results for what-if projections
+    return {
+        "Databases": "All" if TRAKDOCS == ["all"] else includew.strip() + " " + ", ".join(TRAKDOCS),
+        "MB/Episode": DatabaseGrowthTotal / TotalEpisodes,
+        "End MB": df_result.iloc[-1]["DatabaseUsedMB"],
+        "Episodes/Day": df_result.filter(like="EpisodeCount").mean().to_dict(),
+    }
+
+
+# What-if projections ---------------------------------------------------------------------------
+# Scenarios are rows of a csv file, every column but Scenario is optional (0 if missing):
+#   Scenario, Inpatient %, Outpatient %, Emergency %, Extra Inpatient/Day, Extra Outpatient/Day,
+#   Extra Emergency/Day, Growth %/Year
+# eg "+20% inpatient" is Inpatient % 20, a new emergency department is Extra Emergency/Day 150.
+# Episodes per day now come from average_episode_size, changed by the scenario and grown each year. Database
+# size is size now plus episodes to date x MB per episode, for all databases and each -l split. Journals and
+# peak episodes per hour scale with episodes per day. All scenarios x years are one array calculation.
+
+EPISODE_TYPES = ["Inpatient", "Outpatient", "Emergency"]
+
+
+def read_scenarios(filename):
+    df = pd.read_csv(filename)
+    if "Scenario" not in df.columns:
+        raise ValueError("scenario file %s has no Scenario column" % filename)
+    columns = [t + " %" for t in EPISODE_TYPES] + ["Extra " + t + "/Day" for t in EPISODE_TYPES] + ["Growth %/Year"]
+    df = df.reindex(columns=["Scenario"] + columns).fillna({c: 0 for c in columns})
+    baseline = pd.DataFrame([dict({c: 0 for c in columns}, Scenario="Baseline")])
+    return pd.concat([baseline, df[df["Scenario"] != "Baseline"]], ignore_index=True)
+
+
+def project_capacity(DIRECTORY, MonitorAppFile, episode_sizes, journal_gb_per_day, df_scenarios, years):
+    outputName = export_name(MonitorAppFile)
+    outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_Projection"
+    outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName + "_Projection"
+    print("Projection: %s" % outputName)
+
+    # Episodes per day now by type, anything not inpatient, outpatient or emergency is Other
+    now = episode_sizes[0]["Episodes/Day"]
+    base = np.array([now.get("EpisodeCount" + t, 0.0) for t in EPISODE_TYPES])
+    base = np.r_[base, max(now["EpisodeCountTotal"] - base.sum(), 0.0)]
+    base_total = base.sum()
+    df_app = read_monitor(MonitorAppFile, "rollup_app")
+    peak_hour = df_app["EpisodePeakPerHourCount"].max() if "EpisodePeakPerHourCount" in df_app else np.nan
+
+    # scenarios x types
+    uplift = np.c_[df_scenarios[[t + " %" for t in EPISODE_TYPES]].to_numpy(float) / 100, np.zeros(len(df_scenarios))]
+    extra = np.c_[
+        df_scenarios[["Extra " + t + "/Day" for t in EPISODE_TYPES]].to_numpy(float), np.zeros(len(df_scenarios))
+    ]
+    growth = df_scenarios["Growth %/Year"].to_numpy(float) / 100
+
+    # scenarios x years x types, year 0 is now
+    year = np.arange(years + 1)
+    per_day = (base * (1 + uplift) + extra)[:, None, :] * (1 + growth[:, None, None]) ** year[None, :, None]
+    per_day[:, 0, :] = base
+    total_per_day = per_day.sum(axis=2)
+    episodes_year = np.where(year > 0, total_per_day * 365, 0)
+    episodes_to_date = np.cumsum(episodes_year, axis=1)
+
+    # scenarios x years x database splits
+    end_mb = np.array([size["End MB"] for size in episode_sizes])
+    mb_per_episode = np.array([size["MB/Episode"] for size in episode_sizes])
+    database_gb = (end_mb + episodes_to_date[:, :, None] * mb_per_episode) / 1024
+
+    scale = total_per_day / base_total
+    journal = (np.nan if journal_gb_per_day is None else journal_gb_per_day) * scale
+
+    S, Y = total_per_day.shape
+    df_projection = pd.DataFrame(
+        {
+            "Scenario": np.repeat(df_scenarios["Scenario"].to_numpy(), Y),
+            "Year": np.tile(year, S),
+            "Episodes/Day": total_per_day.ravel(),
+            "Episodes/Year": episodes_year.ravel(),
+        }
+    )
+    for k, episode_type in enumerate(EPISODE_TYPES):
+        df_projection[episode_type + "/Day"] = per_day[:, :, k].ravel()
+    for k, size in enumerate(episode_sizes):
+        df_projection["Database GB " + size["Databases"]] = database_gb[:, :, k].ravel()
+    df_projection["Journal GB/Day"] = journal.ravel()
+    df_projection["Peak Episodes/Hour"] = (peak_hour * scale).ravel()
+    write_csv(df_projection, outputFile_csv + ".csv", sep=",", index=False)
+
+    if not DRAW_CHARTS:
+        return
+
+    plt.style.use("seaborn-whitegrid")
+    fig, axes = plt.subplots(1, 3, figsize=(16, 6), dpi=300)
+    for ax, values, title in zip(
+        axes,
+        [database_gb[:, :, 0], journal, peak_hour * scale],
+        ["Database Size (GB)", "Journals per Day (GB)", "Peak Episodes per Hour"],
+    ):
+        for s, name in enumerate(df_scenarios["Scenario"]):
+            ax.plot(year, values[s], marker="o", markersize=3, label=name, linestyle="--" if s == 0 else "-")
+        ax.set_title(title, fontsize=12)
+        ax.set_xlabel("Years from now", fontsize=10)
+        ax.set_xticks(year)
+        ax.set_ylim(bottom=0)
+        ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+    axes[0].legend(loc="upper left", fontsize=8)
+    fig.suptitle("What-if Projections " + str(years) + " Years - " + outputName, fontsize=14)
+    fig.tight_layout()
+    save_figure(outputFile_png + ".png", fig=fig, format="png")
+    plt.close(fig)
+
+
+# Correlation of every column of X (dates x pages, NaN where a page has no row) with every column of E
+# (dates x episode counts), missing days are left out pair by pair. Sums as matrix products, one pass for all pages.
+
+
+def masked_correlation(X, E):
+    M = (~np.isnan(X)).astype(float)
+    Xz = np.nan_to_num(X)
+    n = M.sum(axis=0)[:, None]
+    sx, sxx = Xz.sum(axis=0)[:, None], (Xz**2).sum(axis=0)[:, None]
+    se, see, sxe = M.T @ E, M.T @ E**2, Xz.T @ E
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxe - sx * se / n
+        var_x = sxx - sx**2 / n
+        var_e = see - se**2 / n
+        r = cov / np.sqrt(var_x * var_e)
+    return np.where(n >= 3, r, np.nan)
+
+
+# Compute side of sizing - page summary workload (hits, globals, time) per episode, next to MB per episode
+
+
+def cost_per_episode(DIRECTORY, MonitorAppFile, MonitorPageSummaryFile):
+    outputName = export_name(MonitorPageSummaryFile)
+    outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_Summary"
+    outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName + "_Summary"
+    print("Cost per episode: %s" % outputName)
+
+    # Episodes by day, splits that are empty in this version of TC are left out
+    df_master_ep = read_monitor(MonitorAppFile, "rollup_app", last=True).dropna(axis=1, how="all")
+    df_master_ep = df_master_ep.rename(columns={"RunDate": "Date"})
+    episode_columns = [
+        c
+        for c in ["EpisodeCountTotal", "EpisodeCountInpatient", "EpisodeCountOutpatient", "EpisodeCountEmergency"]
+        if c in df_master_ep.columns
+    ]
+    df_ep_by_date = df_master_ep.groupby("Date")[episode_columns].sum()
+
+    # Page summary totals for all pages by day
+    df_master_ps = read_monitor(MonitorPageSummaryFile, "pages", last=True).rename(columns={"RunDate": "Date"})
+    workload = ["TotalHits", "SumPGlobals", "SumPTime"]
+    df_ps_by_date = df_master_ps.groupby("Date")[workload].sum()
+
+    # Only days with both
+    df_result = df_ep_by_date.join(df_ps_by_date, how="inner")
+    if df_result.empty:
+        print("Cost per episode: no days in both exports, skipped")
+        return
+    df_result.index = to_dates(df_result.index)
+
+    per = {"TotalHits": "Hits", "SumPGlobals": "Globals", "SumPTime": "Time"}
+    split = {
+        "EpisodeCountTotal": "Episode",
+        "EpisodeCountInpatient": "Inpatient Episode",
+        "EpisodeCountOutpatient": "Outpatient Episode",
+        "EpisodeCountEmergency": "Emergency Episode",
+    }
+    for episodes in episode_columns:
+        count = df_result[episodes].where(df_result[episodes] > 0)
+        for metric in workload:
+            df_result[per[metric] + "/" + split[episodes]] = df_result[metric] / count
+    write_csv(df_result, outputFile_csv + "_Cost_Per_Episode.csv", sep=",", index=True)
+
+    # Every page against every episode count
+    dates = df_result.index
+    E = df_result[episode_columns].to_numpy(dtype=float)
+    df_master_ps["Date"] = to_dates(df_master_ps["Date"])
+    df_master_ps = df_master_ps[df_master_ps["Date"].isin(dates)]
+
+    df_pages = pd.DataFrame(index=pd.Index(sorted(df_master_ps["pName"].unique()), name="pName"))
+    total_episodes = df_result["EpisodeCountTotal"].sum()
+    for metric in ["TotalHits", "SumPGlobals"]:
+        matrix = dense_matrix(df_master_ps, "pName", metric).reindex(index=dates, columns=df_pages.index)
+        df_pages[per[metric] + "/Episode"] = np.nansum(matrix.to_numpy(), axis=0) / total_episodes
+        r = masked_correlation(matrix.to_numpy(), E)
+        for k, episodes in enumerate(episode_columns):
+            df_pages[metric + " vs " + episodes + " r"] = r[:, k]
+    df_pages = df_pages.sort_values(by=["Globals/Episode"], ascending=False)
+    write_csv(df_pages, outputFile_csv + "_Page_Cost_Per_Episode.csv", sep=",", index=True)
+
+    TITLEDATES = dates[0].strftime("%d/%m/%Y") + " - " + dates[-1].strftime("%d/%m/%Y")
+    generic_plot(
+        df_result,
+        "Globals/Episode",
+        "Sum Globals per Episode  " + TITLEDATES,
+        "Globals per episode",
+        outputFile_png + "_Globals_Per_Episode.png",
+        plot_text_string="Average globals/episode: "
+        + "{v:,.0f}".format(v=df_result["SumPGlobals"].sum() / total_episodes),
+    )
+    generic_plot(
+        df_result,
+        "Hits/Episode",
+        "Page Hits per Episode  " + TITLEDATES,
+        "Hits per episode",
+        outputFile_png + "_Hits_Per_Episode.png",
+        pres=True,
+        plot_text_string="Average hits/episode: " + "{v:,.2f}".format(v=df_result["TotalHits"].sum() / total_episodes),
+    )
+
+
+# Attribute database growth to globals ---------------------------------------------------
+# Globals know their DataBasePath, databases their Name. Join the two on the database directory if the
+# database export has one, otherwise on the last folder of the path (usually the database name).
+
+DATABASE_PATH_COLUMNS = ["Directory", "DatabaseDirectory", "DataBasePath", "Path"]
+
+
+# Key for joining paths - separators flattened as in add_full_global, case folded for Windows paths
+
+
+def path_key(path):
+    path = path.astype(str).str.upper().str.replace(r"[\\/:]+", "_", regex=True)
+    return path.str.strip("_")
+
+
+def growth_attribution(DIRECTORY, MonitorGlobalsFile, MonitorDatabaseFile, top_n=10, top_globals=5):
+    outputName = export_name(MonitorGlobalsFile)
+    outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_Summary"
+    outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName + "_Summary"
+    print("Growth attribution: %s" % outputName)
+
+    df_master_db = read_monitor(MonitorDatabaseFile, "attribution_db", last=True).dropna(axis=1, how="all")
+    df_master_db = df_master_db.rename(columns={"RunDate": "Date"})
+    df_master_db["Date"] = to_dates(df_master_db["Date"])
+    df_master_db["DatabaseUsedMB"] = df_master_db["SizeinMB"] - df_master_db["FreeSpace"]
+
+    # Size at start and end for every global, from the histories saved by the globals stage
+    histories = global_histories(DIRECTORY, MonitorGlobalsFile)
+    df_growth = histories.summary()
+    df_growth["DataBasePath"] = histories.paths
+
+    # Map path to database name
+    path_column = next((c for c in DATABASE_PATH_COLUMNS if c in df_master_db.columns), None)
+    df_names = df_master_db.drop_duplicates(subset=["Name"], keep="last")
+    if path_column is not None:
+        df_map = pd.DataFrame({"Key": path_key(df_names[path_column]), "Name": df_names["Name"]})
+        df_growth["Key"] = path_key(df_growth["DataBasePath"])
+    else:
+        print("Growth attribution: no database directory in %s, matching on folder name" % MonitorDatabaseFile)
+        df_map = pd.DataFrame({"Key": df_names["Name"].str.upper(), "Name": df_names["Name"]})
+        df_growth["Key"] = df_growth["DataBasePath"].str.rstrip("/\\").str.split(r"[\\/:]").str[-1].str.upper()
+    df_growth = pd.merge(df_growth, df_map.drop_duplicates(subset=["Key"]), on="Key", how="left")
+    df_growth["Name"] = df_growth["Name"].fillna("Unmapped")
+
+    # Database growth from the database export, what the globals don't explain is Unattributed
+    grouped = df_master_db.groupby("Name")["DatabaseUsedMB"]
+    df_db_growth = (grouped.last() - grouped.first()).rename("Database Growth")
+    df_by_db = df_growth.groupby("Name")["Growth Size"].sum().rename("Globals Growth").to_frame()
+    df_by_db = df_by_db.join(df_db_growth, how="outer")
+    df_by_db["Unattributed"] = df_by_db["Database Growth"] - df_by_db["Globals Growth"].fillna(0)
+    df_by_db = df_by_db.sort_values(by=["Database Growth"], ascending=False).reset_index()
+    write_csv(df_by_db, outputFile_csv + "_Growth_By_Database.csv", sep=",", index=False)
+
+    # Every global with its share of its database's globals growth
+    df_growth = df_growth.sort_values(by=["Name", "Growth Size", "Full_Global"], ascending=[True, False, True])
+    database_total = df_growth.groupby("Name")["Growth Size"].transform("sum")
+    df_growth["Share %"] = df_growth["Growth Size"] * 100 / database_total.where(database_total != 0)
+    write_csv(
+        df_growth[["Name", "Full_Global", "Start Size", "End Size", "Growth Size", "Share %"]],
+        outputFile_csv + "_Growth_By_Database_Global.csv",
+        sep=",",
+        index=False,
+    )
 
+    if not DRAW_CHARTS:
+        return
+
+    # Stacked contribution of the top globals in each of the top growth databases, the rest as Other
+    databases = df_by_db[df_by_db["Name"] != "Unmapped"].dropna(subset=["Globals Growth"]).head(top_n)["Name"]
+    df_top = df_growth[df_growth["Name"].isin(databases) & (df_growth["Growth Size"] > 0)].copy()
+    if df_top.empty:
+        return
+    df_top["Rank"] = df_top.groupby("Name").cumcount()
+    df_top.loc[df_top["Rank"] >= top_globals, ["Rank", "Full_Global"]] = [top_globals, "Other"]
+    df_top = df_top.groupby(["Name", "Rank", "Full_Global"], as_index=False)["Growth Size"].sum()
+
+    order = list(databases[databases.isin(df_top["Name"])])[::-1]  # Biggest at the top
+    position = {name: i for i, name in enumerate(order)}
+    palette = sns.color_palette("Paired", top_globals + 1)
+
+    plt.style.use("seaborn-whitegrid")
+    plt.figure(num=None, figsize=(16, max(4, len(order) * 0.6)), dpi=300)
+    ax = plt.gca()
+    left = np.zeros(len(order))
+    total_width = df_top.groupby("Name")["Growth Size"].sum().max()
+    for rank, df_rank in df_top.groupby("Rank"):
+        y = df_rank["Name"].map(position).to_numpy()
+        width = df_rank["Growth Size"].to_numpy()
+        ax.barh(y, width, left=left[y], color=palette[rank], edgecolor="white")
+        for yi, x0, w, label in zip(y, left[y], width, df_rank["Full_Global"]):
+            if w > total_width * 0.06:  # Only label segments wide enough to read
+                ax.text(x0 + w / 2, yi, label, ha="center", va="center", fontsize=7)
+        left[y] += width
+
+    plt.yticks(range(len(order)), order, fontsize=10)
+    plt.title("Growth by Global for Top " + str(top_n) + " Databases", fontsize=14)
+    plt.xlabel("Growth over period (MB)", fontsize=10)
+    ax.xaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+    plt.tight_layout()
+    save_figure(outputFile_png + "_Growth_By_Database.png", format="png")
+    plt.close()
+
+
+# Weekly and monthly rollups -------------------------------------------------------------
+# Aggregate per-day rows once per period: sums, means and maxes, and sizes at the end of the period.
+
+ROLLUP_PERIODS = {"Weekly": "W", "Monthly": "M"}
+
+
+# Text added to cached file names when a date window is set, so different windows don't share a cache
+
+
+def window_tag():
+    since, until = DATE_WINDOW
+    if since is None and until is None:
+        return ""
+    tag = "_" + ("start" if since is None else since.strftime("%Y%m%d"))
+    return tag + "_" + ("end" if until is None else (until - pd.Timedelta(days=1)).strftime("%Y%m%d"))
+
+
+# Group rows by period (and keys), aggregations are named as for DataFrame.agg eg {"Episodes Sum": (col, "sum")}
+
+
+def rollup_table(df, keys, aggregations, period):
+    df = df.sort_values(by=["Date"])  # So "last" is the end of the period
+    period_start = df["Date"].dt.to_period(period).dt.start_time.rename("Period")
+    aggregations = {name: how for name, how in aggregations.items() if how[0] in df.columns}
+    return df.groupby([period_start] + keys).agg(**aggregations).reset_index()
+
+
+# Rollup csv is the cache, rebuilt only if the export is newer or it doesn't exist yet
+
+
+def cached_rollup(source, save_as, build):
+    if os.path.exists(save_as) and os.path.getmtime(save_as) >= export_mtime(source):
+        return pd.read_csv(save_as, parse_dates=["Period"])
+    df = build()
+    write_csv(df, save_as, sep=",", index=False)
+    return df
+
+
+def rollups(DIRECTORY, MonitorAppName, MonitorDatabaseName, MonitorGlobalsName, MonitorPageSummaryName):
+    os.makedirs(DIRECTORY + "/all_rollup", exist_ok=True)
+
+    def frame(filename, stage):
+        df = read_monitor(filename, stage).rename(columns={"RunDate": "Date"})
+        df["Date"] = to_dates(df["Date"])
+        return df
+
+    sources = [
+        (
+            MonitorAppName,
+            "rollup_app",
+            [],
+            {
+                "Episodes Sum": ("EpisodeCountTotal", "sum"),
+                "Episodes Mean/Day": ("EpisodeCountTotal", "mean"),
+                "Episodes Peak/Day": ("EpisodeCountTotal", "max"),
+                "Inpatient Sum": ("EpisodeCountInpatient", "sum"),
+                "Outpatient Sum": ("EpisodeCountOutpatient", "sum"),
+                "Emergency Sum": ("EpisodeCountEmergency", "sum"),
+                "Orders Sum": ("OrderCountTotal", "sum"),
+                "Episodes Peak/Hour": ("EpisodePeakPerHourCount", "max"),
+            },
+        ),
+        (
+            MonitorDatabaseName,
+            "episode_size_db",
+            ["Name"],
+            {
+                "DatabaseUsedMB End": ("DatabaseUsedMB", "last"),
+                "DatabaseUsedMB Max": ("DatabaseUsedMB", "max"),
+                "SizeinMB End": ("SizeinMB", "last"),
+            },
+        ),
+        (
+            MonitorGlobalsName,
+            "globals",
+            ["Full_Global"],
+            {"SizeAllocated End": ("SizeAllocated", "last"), "SizeAllocated Max": ("SizeAllocated", "max")},
+        ),
+        (
+            MonitorPageSummaryName,
+            "pages",
+            ["pName"],
+            {
+                "TotalHits Sum": ("TotalHits", "sum"),
+                "SumPGlobals Sum": ("SumPGlobals", "sum"),
+                "SumPTime Sum": ("SumPTime", "sum"),
+                "AvgPGlobals Mean": ("AvgPGlobals", "mean"),
+                "MaxPGlobals Max": ("MaxPGlobals", "max"),
+            },
+        ),
+    ]
+
+    for filenames, stage, keys, aggregations in sources:
+        for filename in filenames:
+            outputName = export_name(filename)
+            print("Rollups: %s" % outputName)
+            loaded = {}
+
+            def build(period):
+                if stage == "globals":  # From the change points the globals stage saved, not the export
+                    if "histories" not in loaded:
+                        loaded["histories"] = global_histories(DIRECTORY, filename)
+                    return loaded["histories"].rollup(ROLLUP_PERIODS[period])
+                if "df" not in loaded:  # Only parse if a rollup is out of date
+                    df = frame(filename, stage)
+                    if stage == "episode_size_db":
+                        df["DatabaseUsedMB"] = df["SizeinMB"] - df["FreeSpace"]
+                    loaded["df"] = df
+                return rollup_table(loaded["df"], keys, aggregations, ROLLUP_PERIODS[period])
+
+            for period in ROLLUP_PERIODS:
+                save_as = DIRECTORY + "/all_rollup/" + outputName + "_" + period + window_tag() + ".csv"
+                df_rollup = cached_rollup(filename, save_as, lambda: build(period))
+
+                # Coarse charts of the site totals
+                outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_" + period
+                if stage == "rollup_app":
+                    generic_plot(
+                        df_rollup.set_index("Period"),
+                        "Episodes Sum",
+                        period + " Episodes",
+                        "Episodes per " + period.replace("ly", ""),
+                        outputFile_png + "_Episodes.png",
+                    )
+                elif stage == "episode_size_db":
+                    df_total = df_rollup.groupby("Period").sum(numeric_only=True)
+                    generic_plot(
+                        df_total,
+                        "DatabaseUsedMB End",
+                        period + " Total Database Used at End of Period",
+                        "(MB)",
+                        outputFile_png + "_Database_Used.png",
+                    )
+                elif stage == "pages":
+                    df_total = df_rollup.groupby("Period").sum(numeric_only=True)
+                    generic_plot(
+                        df_total,
+                        "SumPGlobals Sum",
+                        period + " Sum Globals All Pages",
+                        "Sum Globals",
+                        outputFile_png + "_Sum_Globals.png",
+                    )
+
+
+def mainline(
+    DIRECTORY,
+    TRAKDOCS,
+    Do_Globals,
+    Disk_Size=None,
+    Do_Charts=True,
+    Since=None,
+    Until=None,
+    Do_Rollups=False,
+    Scenarios=None,
+    Years=5,
+    Shards=1,
+):
+    use_charts(Do_Charts)
+    set_date_window(Since, Until)
+
+    # What-if scenarios, read first so a bad file is found before the long part
+    df_scenarios = None
+    if Scenarios is not None:
+        try:
+            df_scenarios = read_scenarios(Scenarios)
+        except (OSError, ValueError) as e:
+            print("What-if projections skipped: %s" % str(e))
 
-def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
     TITLEDATES = ""
     # Top N values. To do; make parameters
     TopNDatabaseByGrowth = 15
     TopNDatabaseByGrowthPie = 5
     TopNDatabaseByGrowthStack = 9
+    ForecastDays = 365
+    AnomalyWindow = 14  # Days in rolling baseline
+    AnomalyThreshold = 3.5  # Robust z score
 
     colormapName = "Set1"
     # plt.style.use('seaborn-whitegrid')
@@ -519,32 +2422,52 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
     # plt.plot(df_master['CPU'], color=color, alpha=0.7)
     # ax.grid(which='major', axis='both', linestyle='--')
 
-    # Get list of files in directory, can have multiples of same type if follow regex
-    MonitorAppName = glob.glob(DIRECTORY + "/*MonitorApp.txt")
-    MonitorDatabaseName = glob.glob(DIRECTORY + "/*MonitorDatabase.txt")
-    MonitorGlobalsName = glob.glob(DIRECTORY + "/*MonitorGlobals.txt")
-    MonitorJournalsName = glob.glob(DIRECTORY + "/*MonitorJournals.txt")
-    MonitorPageSummaryName = glob.glob(DIRECTORY + "/*MonitorPageSummary.txt")
+    # Get list of files in directory, can have multiples of same type if follow regex.
+    # Exports can also be in .zip or .tar.gz archives in the directory, or -d can be an archive.
+    EXPORTS, DIRECTORY = DIRECTORY, output_folder(DIRECTORY)
+    MonitorAppName = monitor_exports(EXPORTS, "MonitorApp")
+    MonitorDatabaseName = monitor_exports(EXPORTS, "MonitorDatabase")
+    MonitorGlobalsName = monitor_exports(EXPORTS, "MonitorGlobals")
+    MonitorJournalsName = monitor_exports(EXPORTS, "MonitorJournals")
+    MonitorPageSummaryName = monitor_exports(EXPORTS, "MonitorPageSummary")
+
+    # Sniff every export before parsing, malformed ones are left out rather than failing part way through.
+    # Exports can change between runs in watch mode, so layouts are found again each run.
+    EXPORT_SCHEMAS.clear()
+    MonitorAppName = checked_exports(MonitorAppName)
+    MonitorDatabaseName = checked_exports(MonitorDatabaseName)
+    MonitorGlobalsName = checked_exports([] if Do_Globals else MonitorGlobalsName)
+    MonitorJournalsName = checked_exports(MonitorJournalsName)
+    MonitorPageSummaryName = checked_exports(MonitorPageSummaryName)
+
+    # Parse everything up front, concurrently. Globals are big, don't read them if not needed.
+    prefetch_exports(
+        MonitorAppName + MonitorDatabaseName + MonitorGlobalsName + MonitorJournalsName + MonitorPageSummaryName
+    )
+
+    # Manifest of this run, in all_manifest
+    start_run(
+        DIRECTORY,
+        MonitorAppName + MonitorDatabaseName + MonitorGlobalsName + MonitorJournalsName + MonitorPageSummaryName,
+    )
 
     # Create directories for generated csv and png files
-    if not os.path.exists(DIRECTORY + "/all_out_png"):
-        os.mkdir(DIRECTORY + "/all_out_png")
-    if not os.path.exists(DIRECTORY + "/all_out_csv"):
-        os.mkdir(DIRECTORY + "/all_out_csv")
-    if not os.path.exists(DIRECTORY + "/all_database"):
-        os.mkdir(DIRECTORY + "/all_database")
+    os.makedirs(DIRECTORY + "/all_out_png", exist_ok=True)
+    os.makedirs(DIRECTORY + "/all_out_csv", exist_ok=True)
+    os.makedirs(DIRECTORY + "/all_database", exist_ok=True)
 
     # Journals -------------------------------------------------------------------------
     # Total by day and output chart and processed data as csv
 
+    journal_gb_per_day = {}  # For what-if projections, by export prefix (site)
     for filename in MonitorJournalsName:
-        outputName = os.path.splitext(os.path.basename(filename))[0]
+        outputName = export_name(filename)
         outputFile_png = DIRECTORY + "/all_out_png/" + outputName
         outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName
         print("Journals: %s" % outputName)
 
         # Read in journal details, index on create date (column 3), sort on create date
-        df_master = pd.read_csv(filename, sep="\t", encoding="ISO-8859-1", index_col=2, parse_dates=[2])
+        df_master = read_monitor(filename, index_col=2, last=True)
         df_master = df_master.dropna(axis=1, how="all")
         df_master.sort_index(inplace=True)
 
@@ -565,21 +2488,39 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         cutoff_date = df_master["Create Date"].max() - pd.Timedelta(days=goBackDays)
         df_last_week = df_master[df_master["Create Date"] > cutoff_date]
 
-        df_last_week.to_csv(outputFile_csv + "_Last_Week.csv", sep=",")
+        write_csv(df_last_week, outputFile_csv + "_Last_Week.csv", sep=",")
 
         # Start and end dates to display
         RunDateStart = df_last_week.head(1).index.strftime("%d/%m/%Y")
         RunDateEnd = df_last_week.tail(1).index.strftime("%d/%m/%Y")
         TITLEDATES = str(RunDateStart[0]) + " to " + str(RunDateEnd[0])
 
-        plt.figure(figsize=(16, 6), dpi=300)
-        plt.title("Journals switches across day  " + TITLEDATES, fontsize=14)
-        plt.tick_params(labelsize=10)
-
-        count_plot = sns.swarmplot(x="Create Day", y="Create Hour", data=df_last_week, hue="Reason", dodge=True)
-        fig = count_plot.get_figure()
-        fig.savefig(outputFile_png + "_swarm_plot.png")
-        fig.clf()
+        # Day of week x time of day (quarter hours), one panel per switch reason. Drawn as an image so a site with
+        # thousands of switches a day is as quick as a quiet one.
+        reasons = df_last_week["Reason"].dropna().unique()
+        if DRAW_CHARTS and len(reasons) > 0:
+            fig, axes = plt.subplots(1, len(reasons), figsize=(16, 6), dpi=300, sharey=True, squeeze=False)
+            fig.suptitle("Journals switches across day  " + TITLEDATES, fontsize=14)
+            created = df_last_week.index
+            for ax, reason in zip(axes[0], reasons):
+                rows = (df_last_week["Reason"] == reason).to_numpy()
+                raster_plot(
+                    ax,
+                    created.dayofweek[rows],
+                    created.hour[rows] + created.minute[rows] / 60,
+                    bins=(7, 96),
+                    extent=[-0.5, 6.5, 0, 24],
+                    cmap="rocket_r",
+                    label="Switches",
+                )
+                ax.set_title(reason, fontsize=10)
+                ax.set_xticks(range(7))
+                ax.set_xticklabels(["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
+                ax.tick_params(labelsize=10)
+            axes[0][0].set_yticks(range(0, 25, 3))
+            axes[0][0].set_ylabel("Create Hour", fontsize=10)
+            save_figure(outputFile_png + "_swarm_plot.png", fig=fig)
+            plt.close(fig)
 
         # Fun over, just usual chart....
         # Start and end dates to display
@@ -606,21 +2547,25 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
             TextString,
         )
 
-        df_day.to_csv(outputFile_csv + "_by_Day.csv", sep=",")
+        write_csv(df_day, outputFile_csv + "_by_Day.csv", sep=",")
+        journal_gb_per_day[export_prefix(filename)] = df_day["Size"].mean() / (1024 * 1024 * 1024)
+
+        # Switch intervals, write rates and hourly peaks over the whole history
+        journal_analytics(df_master, outputFile_csv, outputFile_png, TITLEDATES)
 
     # Episodes  -------------------------------------------------------------------------
     # Output a few useful charts and convert input to csv
 
     for filename in MonitorAppName:
-        outputName = os.path.splitext(os.path.basename(filename))[0]
+        outputName = export_name(filename)
         outputFile_png = DIRECTORY + "/all_out_png/" + outputName
         outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName
         print("Episodes: %s" % outputName)
 
-        df_master_ep = pd.read_csv(filename, sep="\t", encoding="ISO-8859-1", parse_dates=[0], index_col=0)
+        df_master_ep = read_monitor(filename, index_col=0)
         df_master_ep = df_master_ep.dropna(axis=1, how="all")
         df_master_ep.index.names = ["Date"]
-        df_master_ep.to_csv(outputFile_csv + ".csv", sep=",")
+        write_csv(df_master_ep, outputFile_csv + ".csv", sep=",")
 
         RunDateStart = df_master_ep.head(1).index.tolist()
         RunDateStart = RunDateStart[0].strftime("%d/%m/%Y")
@@ -664,58 +2609,61 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
 
         # Example of multiple charts. To do; Make this a function to accept any number of items
 
-        plt.style.use("seaborn-whitegrid")
-        plt.figure(num=None, figsize=(16, 6), dpi=300)
-        palette = plt.get_cmap(colormapName)
-        color = palette(1)
+        if DRAW_CHARTS:
+            plt.style.use("seaborn-whitegrid")
+            plt.figure(num=None, figsize=(16, 6), dpi=300)
+            palette = plt.get_cmap(colormapName)
+            color = palette(1)
 
-        plt.plot(df_master_ep["EpisodeCountTotal"], label="Total Episodes Per Day")
-        plt.plot(df_master_ep["OrderCountTotal"], label="Total Orders Per Day")
-        plt.legend(loc="best")
+            ax = plt.gca()
+            dates = df_master_ep.index.values
+            plot_downsampled(ax, dates, df_master_ep["EpisodeCountTotal"].values, label="Total Episodes Per Day")
+            plot_downsampled(ax, dates, df_master_ep["OrderCountTotal"].values, label="Total Orders Per Day")
+            plt.legend(loc="best")
 
-        plt.title("Episodes and Orders by Day  " + TITLEDATES, fontsize=14)
-        plt.ylabel("Count", fontsize=10)
-        plt.tick_params(labelsize=10)
-        ax = plt.gca()
-        ax.set_ylim(bottom=0)  # Always zero start
-        ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
-        ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
-        plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
-        plt.tight_layout()
-        plt.savefig(outputFile_png + "_Ttl_Episodes_Orders.png", format="png")
-        plt.close()
+            plt.title("Episodes and Orders by Day  " + TITLEDATES, fontsize=14)
+            plt.ylabel("Count", fontsize=10)
+            plt.tick_params(labelsize=10)
+            ax = plt.gca()
+            ax.set_ylim(bottom=0)  # Always zero start
+            ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+            ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
+            plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+            plt.tight_layout()
+            save_figure(outputFile_png + "_Ttl_Episodes_Orders.png", format="png")
+            plt.close()
 
-        plt.style.use("seaborn-whitegrid")
-        plt.figure(num=None, figsize=(16, 6), dpi=300)
-        palette = plt.get_cmap(colormapName)
-        color = palette(1)
+            plt.style.use("seaborn-whitegrid")
+            plt.figure(num=None, figsize=(16, 6), dpi=300)
+            palette = plt.get_cmap(colormapName)
+            color = palette(1)
 
-        # What are the busiest days?
-        df_master_ep["Day"] = df_master_ep.index.to_series().dt.day_name()
+            # What are the busiest days?
+            df_master_ep["Day"] = df_master_ep.index.to_series().dt.day_name()
 
-        plt.title("Episodes by Day " + TITLEDATES, fontsize=14)
-        plt.tick_params(labelsize=10)
+            plt.title("Episodes by Day " + TITLEDATES, fontsize=14)
+            plt.tick_params(labelsize=10)
 
-        count_plot = sns.swarmplot(x="Day", y="EpisodeCountTotal", data=df_master_ep)
-        count_plot.set(ylabel="Count", xlabel="")
-        count_plot.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+            count_plot = sns.swarmplot(x="Day", y="EpisodeCountTotal", data=df_master_ep)
+            count_plot.set(ylabel="Count", xlabel="")
+            count_plot.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
 
-        fig = count_plot.get_figure()
-        fig.savefig(outputFile_png + "_swarm_plot.png")
+            fig = count_plot.get_figure()
+            save_figure(outputFile_png + "_swarm_plot.png", fig=fig)
 
     # Databases  -------------------------------------------------------------------------
     # Total by day and output full list, by day list, top n growth and chart top n growth
 
     for filename in MonitorDatabaseName:
 
-        outputName = os.path.splitext(os.path.basename(filename))[0]
+        outputName = export_name(filename)
         outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_Summary"
         outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName + "_Summary"
         print("Databases: %s" % outputName)
 
         # What is the total size of all databases? includes CACHETEMP
 
-        df_master_db = pd.read_csv(filename, sep="\t", encoding="ISO-8859-1", parse_dates=[0], index_col=0)
+        df_master_db = read_monitor(filename, index_col=0)
         df_master_db = df_master_db.dropna(axis=1, how="all")
 
         df_master_db.index.names = ["Date"]
@@ -723,8 +2671,8 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
 
         df_db_by_date = df_master_db.groupby("Date").sum()
 
-        df_master_db.to_csv(outputFile_csv + "_Size.csv", sep=",")
-        df_db_by_date.to_csv(outputFile_csv + "_Size_by_date.csv", sep=",")
+        write_csv(df_master_db, outputFile_csv + "_Size.csv", sep=",")
+        write_csv(df_db_by_date, outputFile_csv + "_Size_by_date.csv", sep=",")
 
         # Data growth
         TextString = (
@@ -779,7 +2727,7 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         # What are the high growth databases in this period?
         # Get database sizes, dont key by date as we will use this field
 
-        df_master_db = pd.read_csv(filename, sep="\t", encoding="ISO-8859-1")
+        df_master_db = read_monitor(filename)
         df_master_db = df_master_db.dropna(axis=1, how="all")
         df_master_db = df_master_db.rename(columns={"RunDate": "Date"})
         df_master_db["DatabaseUsedMB"] = df_master_db["SizeinMB"] - df_master_db["FreeSpace"]
@@ -799,92 +2747,124 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
                     df_temp["DatabaseUsedMB"].iloc[1] - df_temp["DatabaseUsedMB"].iloc[0],
                 ]
             )
-            df_master_db.loc[df_master_db["Name"] == row["Name"]].to_csv(
-                DIRECTORY + "/all_database/Database_" + row["Name"] + ".csv",
+            write_csv(
+                df_master_db.loc[df_master_db["Name"] == row["Name"]],
+                DIRECTORY + "/all_database/" + outputName + "_Database_" + row["Name"] + ".csv",
                 sep=",",
                 index=False,
             )
 
         # Lets see growth over sample period in some charts
         df_databases_by_growth = pd.DataFrame(lst, columns=cols).sort_values(by=["Growth MB"], ascending=False)
-        df_databases_by_growth.to_csv(outputFile_csv + ".csv", sep=",", index=False)
+        write_csv(df_databases_by_growth, outputFile_csv + ".csv", sep=",", index=False)
 
         # What are the top N databses by growth? df_databases_by_growth will hold the sorted list
-        df_databases_by_growth.head(TopNDatabaseByGrowth).to_csv(
+        write_csv(
+            df_databases_by_growth.head(TopNDatabaseByGrowth),
             outputFile_csv + "_top_" + str(TopNDatabaseByGrowth) + ".csv",
             sep=",",
             index=False,
         )
 
         # Bar chart - top N Total Growth
-        plt.style.use("seaborn-whitegrid")
-        plt.figure(num=None, figsize=(16, 6), dpi=300)
-        palette = plt.get_cmap(colormapName)
-        color = palette(1)
-        index = np.arange(len(df_databases_by_growth["Database"].head(TopNDatabaseByGrowth)))
+        if DRAW_CHARTS:
+            plt.style.use("seaborn-whitegrid")
+            plt.figure(num=None, figsize=(16, 6), dpi=300)
+            palette = plt.get_cmap(colormapName)
+            color = palette(1)
+            index = np.arange(len(df_databases_by_growth["Database"].head(TopNDatabaseByGrowth)))
 
-        plt.barh(
-            df_databases_by_growth["Database"].head(TopNDatabaseByGrowth),
-            df_databases_by_growth["Growth MB"].head(TopNDatabaseByGrowth),
-        )
+            plt.barh(
+                df_databases_by_growth["Database"].head(TopNDatabaseByGrowth),
+                df_databases_by_growth["Growth MB"].head(TopNDatabaseByGrowth),
+            )
 
-        plt.title(
-            "Top " + str(TopNDatabaseByGrowth) + " - Database Growth  " + TITLEDATES,
-            fontsize=14,
+            plt.title(
+                "Top " + str(TopNDatabaseByGrowth) + " - Database Growth  " + TITLEDATES,
+                fontsize=14,
+            )
+            plt.xlabel("Growth over period (MB)", fontsize=10)
+            plt.tick_params(labelsize=10)
+            plt.yticks(
+                index,
+                df_databases_by_growth["Database"].head(TopNDatabaseByGrowth),
+                fontsize=10,
+            )
+            ax = plt.gca()
+            ax.xaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+            plt.tight_layout()
+            save_figure(
+                outputFile_png + "_Top_" + str(TopNDatabaseByGrowth) + "_Bar.png",
+                format="png",
+            )
+            plt.close()
+
+        # Growth of top n databases over time (not stacked)
+        df_master_db["Date"] = to_dates(df_master_db["Date"])  # Convert text field to date time, once per distinct date
+
+        # Forecast growth of every database, and the total. Days until expansion is when used reaches the size
+        # on disk at end (database must expand). If the disk size is known, also days until the disk is full, for
+        # all databases only (the disk is shared, one database's growth doesn't tell when it fills).
+        df_last_day = df_master_db[df_master_db["Date"] == df_master_db["Date"].max()]
+        df_db_forecast = forecast_growth(
+            df_master_db,
+            "Name",
+            "DatabaseUsedMB",
+            ForecastDays,
+            limit=df_last_day.groupby("Name")["SizeinMB"].sum(),
         )
-        plt.xlabel("Growth over period (MB)", fontsize=10)
-        plt.tick_params(labelsize=10)
-        plt.yticks(
-            index,
-            df_databases_by_growth["Database"].head(TopNDatabaseByGrowth),
-            fontsize=10,
+        df_total_forecast = forecast_growth(
+            df_db_by_date.reset_index().assign(Name="All Databases"),
+            "Name",
+            "DatabaseUsedMB",
+            ForecastDays,
+            limit=None if Disk_Size is None else Disk_Size * 1024,
         )
-        ax = plt.gca()
-        ax.xaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
-        plt.tight_layout()
-        plt.savefig(
-            outputFile_png + "_Top_" + str(TopNDatabaseByGrowth) + "_Bar.png",
-            format="png",
+        df_db_forecast = df_db_forecast.rename(
+            columns={"Limit": "Size On Disk", "Days Until Limit": "Days Until Expansion"}
         )
-        plt.close()
-
-        # Growth of top n databases over time (not stacked)
-        df_master_db["Date"] = pd.to_datetime(df_master_db["Date"])  # Convert text field to date time
+        df_total_forecast = df_total_forecast.rename(
+            columns={"Limit": "Disk Size", "Days Until Limit": "Days Until Disk Full"}
+        )
+        df_db_forecast = pd.concat([df_total_forecast, df_db_forecast.sort_values(by=["Growth/Day"], ascending=False)])
+        write_csv(df_db_forecast, outputFile_csv + "_Forecast_" + str(ForecastDays) + "_days.csv", sep=",")
 
         top_List = df_databases_by_growth["Database"].head(TopNDatabaseByGrowthStack).tolist()
         grpd = df_master_db.groupby("Name")
 
-        plt.style.use("seaborn-whitegrid")
-        plt.figure(num=None, figsize=(16, 6), dpi=300)
-        palette = plt.get_cmap(colormapName)
-        color = palette(1)
+        if DRAW_CHARTS:
+            plt.style.use("seaborn-whitegrid")
+            plt.figure(num=None, figsize=(16, 6), dpi=300)
+            palette = plt.get_cmap(colormapName)
+            color = palette(1)
 
-        for name, data in grpd:
-            if name in top_List:
-                plt.plot(data.Date.values, data.DatabaseUsedMB.values, "-", label=name)
+            for name, data in grpd:
+                if name in top_List:
+                    plot_downsampled(plt.gca(), data.Date.values, data.DatabaseUsedMB.values, "-", label=name)
+            plot_forecast_overlay(plt.gca(), df_db_forecast, df_master_db["Date"].max(), ForecastDays)
 
-        plt.title("Top Growth Databases (Not Stacked)  " + TITLEDATES, fontsize=14)
-        plt.ylabel("MB", fontsize=10)
-        plt.tick_params(labelsize=10)
-        plt.legend(loc="upper left")
-        ax = plt.gca()
-        ax.set_ylim(bottom=0)  # Always zero start
-        ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
-        ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
-        plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
-        plt.tight_layout()
-        plt.savefig(
-            outputFile_png + "_Top_" + str(TopNDatabaseByGrowthStack) + "_Growth_Time.png",
-            format="png",
-        )
-        plt.close()
+            plt.title("Top Growth Databases (Not Stacked)  " + TITLEDATES, fontsize=14)
+            plt.ylabel("MB", fontsize=10)
+            plt.tick_params(labelsize=10)
+            plt.legend(loc="upper left")
+            ax = plt.gca()
+            ax.set_ylim(bottom=0)  # Always zero start
+            ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+            ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
+            plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+            plt.tight_layout()
+            save_figure(
+                outputFile_png + "_Top_" + str(TopNDatabaseByGrowthStack) + "_Growth_Time.png",
+                format="png",
+            )
+            plt.close()
 
         # Pie chart to show relative sizes, First and Last day of sample period
         FirstDay = df_master_db["Date"].iloc[0]
         df_temp = df_master_db.loc[df_master_db["Date"] == FirstDay]
 
         df_sorted = df_temp.sort_values(by=["DatabaseUsedMB"], ascending=False)
-        df_sorted.to_csv(outputFile_csv + "_pie.csv", sep=",", index=False)
+        write_csv(df_sorted, outputFile_csv + "_pie_Start.csv", sep=",", index=False)
 
         # Drop rows with unmounted databases - size shows up as NaN
         # df_sorted = df_sorted.dropna() <--- cant use this drops too much
@@ -892,40 +2872,45 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         Total_all_db = df_sorted["DatabaseUsedMB"].sum()
         TOTAL_ALL_DB = Total_all_db / 1024
 
-        df_sorted["Labels"] = np.where(df_sorted["DatabaseUsedMB"] * 100 / Total_all_db > 2, df_sorted["Name"], "")
+        df_pie = pie_slices(df_sorted, "Name", "DatabaseUsedMB")
 
-        plt.style.use("seaborn-whitegrid")
+        if DRAW_CHARTS:
+            plt.style.use("seaborn-whitegrid")
 
-        current_palette_10 = sns.color_palette("Paired", 10)
-        sns.set_palette(current_palette_10)
+            current_palette_10 = sns.color_palette("Paired", 10)
+            sns.set_palette(current_palette_10)
 
-        plt.figure(num=None, figsize=(10, 6), dpi=300)
-        pie_exp = tuple(0.1 if i < 2 else 0 for i in range(df_sorted["Name"].count()))  # Pie explode
+            plt.figure(num=None, figsize=(10, 6), dpi=300)
+            pie_exp = tuple(0.1 if i < 2 else 0 for i in range(len(df_pie)))  # Pie explode
 
-        plt.pie(
-            df_sorted["DatabaseUsedMB"],
-            labels=df_sorted["Labels"],
-            autopct=make_autopct(df_sorted["DatabaseUsedMB"]),
-            startangle=60,
-            explode=pie_exp,
-            shadow=True,
-        )
-        plt.title(
-            "Top Database Sizes at Start " + str(FirstDay) + " - Total " + "{v:,.0f}".format(v=TOTAL_ALL_DB) + " GB",
-            fontsize=14,
-        )
+            plt.pie(
+                df_pie["DatabaseUsedMB"],
+                labels=df_pie["Labels"],
+                autopct=make_autopct(df_pie["DatabaseUsedMB"]),
+                startangle=60,
+                explode=pie_exp,
+                shadow=True,
+            )
+            plt.title(
+                "Top Database Sizes at Start "
+                + str(FirstDay)
+                + " - Total "
+                + "{v:,.0f}".format(v=TOTAL_ALL_DB)
+                + " GB",
+                fontsize=14,
+            )
 
-        plt.axis("equal")
-        plt.tight_layout()
-        plt.savefig(outputFile_png + "_Total_DB_Size_Pie_Start.png")
-        plt.close()
+            plt.axis("equal")
+            plt.tight_layout()
+            save_figure(outputFile_png + "_Total_DB_Size_Pie_Start.png")
+            plt.close()
 
         # Last day of sample period
         LastDay = df_master_db["Date"].iloc[-1]
         df_temp = df_master_db.loc[df_master_db["Date"] == LastDay]
 
         df_sorted = df_temp.sort_values(by=["DatabaseUsedMB"], ascending=False)
-        df_sorted.to_csv(outputFile_csv + "_pie.csv", sep=",", index=False)
+        write_csv(df_sorted, outputFile_csv + "_pie_End.csv", sep=",", index=False)
 
         # Drop rows with unmounted databases - size shows up as NaN
         # df_sorted = df_sorted.dropna() <--- cant use this drops too much
@@ -933,29 +2918,30 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         Total_all_db = df_sorted["DatabaseUsedMB"].sum()
         TOTAL_ALL_DB = Total_all_db / 1024
 
-        df_sorted["Labels"] = np.where(df_sorted["DatabaseUsedMB"] * 100 / Total_all_db > 2, df_sorted["Name"], "")
+        df_pie = pie_slices(df_sorted, "Name", "DatabaseUsedMB")
 
-        plt.style.use("seaborn-whitegrid")
-        plt.figure(num=None, figsize=(10, 6), dpi=300)
-        pie_exp = tuple(0.1 if i < 2 else 0 for i in range(df_sorted["Name"].count()))  # Pie explode
+        if DRAW_CHARTS:
+            plt.style.use("seaborn-whitegrid")
+            plt.figure(num=None, figsize=(10, 6), dpi=300)
+            pie_exp = tuple(0.1 if i < 2 else 0 for i in range(len(df_pie)))  # Pie explode
 
-        plt.pie(
-            df_sorted["DatabaseUsedMB"],
-            labels=df_sorted["Labels"],
-            autopct=make_autopct(df_sorted["DatabaseUsedMB"]),
-            startangle=60,
-            explode=pie_exp,
-            shadow=True,
-        )
-        plt.title(
-            "Top Database Sizes at " + str(LastDay) + " - Total " + "{v:,.0f}".format(v=TOTAL_ALL_DB) + " GB",
-            fontsize=14,
-        )
+            plt.pie(
+                df_pie["DatabaseUsedMB"],
+                labels=df_pie["Labels"],
+                autopct=make_autopct(df_pie["DatabaseUsedMB"]),
+                startangle=60,
+                explode=pie_exp,
+                shadow=True,
+            )
+            plt.title(
+                "Top Database Sizes at " + str(LastDay) + " - Total " + "{v:,.0f}".format(v=TOTAL_ALL_DB) + " GB",
+                fontsize=14,
+            )
 
-        plt.axis("equal")
-        plt.tight_layout()
-        plt.savefig(outputFile_png + "_Total_DB_Size_Pie_End.png")
-        plt.close()
+            plt.axis("equal")
+            plt.tight_layout()
+            save_figure(outputFile_png + "_Total_DB_Size_Pie_End.png")
+            plt.close()
 
         # Stacked Chart is a good way to look at Top N- this was more painful than I expected, but hey, its to hot to go outside.
 
@@ -1029,46 +3015,50 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
             all_keys.append(i)
             all_values.append(j)
 
-        plt.style.use("seaborn-whitegrid")
-        plt.figure(num=None, figsize=(16, 6), dpi=300)
+        if DRAW_CHARTS:
+            plt.style.use("seaborn-whitegrid")
+            plt.figure(num=None, figsize=(16, 6), dpi=300)
 
-        palette = plt.get_cmap(colormapName)
-        palette_cycle = sns.color_palette("Set1")
+            palette = plt.get_cmap(colormapName)
+            palette_cycle = sns.color_palette("Set1")
 
-        # print(f"{dates}\n{all_values}\n{all_keys}")
-        # This next plot can fail because of mismatch dates and values
-        plt.stackplot(dates, all_values, labels=all_keys, colors=palette_cycle, alpha=0.5)
+            # print(f"{dates}\n{all_values}\n{all_keys}")
+            # This next plot can fail because of mismatch dates and values
+            plt.stackplot(dates, all_values, labels=all_keys, colors=palette_cycle, alpha=0.5)
 
-        plt.title(
-            "Top " + str(TopNDatabaseByGrowthStack) + " - Database Growth  " + TITLEDATES,
-            fontsize=14,
-        )
-        plt.ylabel("MB", fontsize=10)
-        plt.tick_params(labelsize=10)
-        ax = plt.gca()
-        ax.grid(which="major", axis="both", linestyle="--")
-        ax.set_ylim(bottom=0)  # Always zero start
-        ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
-        ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
-        plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
-        plt.tight_layout()
-        plt.legend(loc="upper left")
+            plt.title(
+                "Top " + str(TopNDatabaseByGrowthStack) + " - Database Growth  " + TITLEDATES,
+                fontsize=14,
+            )
+            plt.ylabel("MB", fontsize=10)
+            plt.tick_params(labelsize=10)
+            ax = plt.gca()
+            ax.grid(which="major", axis="both", linestyle="--")
+            ax.set_ylim(bottom=0)  # Always zero start
+            ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+            ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
+            plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+            plt.tight_layout()
+            plt.legend(loc="upper left")
 
-        plt.savefig(
-            outputFile_png + "_Top_" + str(TopNDatabaseByGrowthStack) + "_Growth_Time_Stack.png",
-            format="png",
-        )
-        plt.close()
+            save_figure(
+                outputFile_png + "_Top_" + str(TopNDatabaseByGrowthStack) + "_Growth_Time_Stack.png",
+                format="png",
+            )
+            plt.close()
 
-        df_top_List.to_csv(outputFile_csv + "_top_list.csv", sep=",", index=False)
+        write_csv(df_top_List, outputFile_csv + "_top_list.csv", sep=",", index=False)
 
     # Average Episode size is good to know  - Merge Episodes and Database growth (grouped by date)
 
-    for index in range(len(MonitorAppName)):
+    for index in range(min(len(MonitorAppName), len(MonitorDatabaseName))):
 
-        # Now plot the data
+        # Now plot the data, Basic_Stats is written once from all the passes
 
-        average_episode_size(DIRECTORY, MonitorAppName[index], MonitorDatabaseName[index], ["all"], True)
+        stats = io.StringIO()
+        episode_sizes = [
+            average_episode_size(DIRECTORY, MonitorAppName[index], MonitorDatabaseName[index], ["all"], True, stats)
+        ]
 
         if TRAKDOCS == [""]:
             print(
@@ -1077,34 +3067,61 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         else:
             if len(TRAKDOCS) > 1:
                 for options in TRAKDOCS:
-                    average_episode_size(
-                        DIRECTORY,
-                        MonitorAppName[index],
-                        MonitorDatabaseName[index],
-                        [options],
-                        True,
+                    episode_sizes.append(
+                        average_episode_size(
+                            DIRECTORY,
+                            MonitorAppName[index],
+                            MonitorDatabaseName[index],
+                            [options],
+                            True,
+                            stats,
+                        )
                     )
-                    average_episode_size(
-                        DIRECTORY,
-                        MonitorAppName[index],
-                        MonitorDatabaseName[index],
-                        [options],
-                        False,
+                    episode_sizes.append(
+                        average_episode_size(
+                            DIRECTORY,
+                            MonitorAppName[index],
+                            MonitorDatabaseName[index],
+                            [options],
+                            False,
+                            stats,
+                        )
                     )
 
-            average_episode_size(
-                DIRECTORY,
-                MonitorAppName[index],
-                MonitorDatabaseName[index],
-                TRAKDOCS,
-                True,
+            episode_sizes.append(
+                average_episode_size(
+                    DIRECTORY,
+                    MonitorAppName[index],
+                    MonitorDatabaseName[index],
+                    TRAKDOCS,
+                    True,
+                    stats,
+                )
+            )
+            episode_sizes.append(
+                average_episode_size(
+                    DIRECTORY,
+                    MonitorAppName[index],
+                    MonitorDatabaseName[index],
+                    TRAKDOCS,
+                    False,
+                    stats,
+                )
             )
-            average_episode_size(
+
+        outputName = export_name(MonitorDatabaseName[index])
+        with open_output(DIRECTORY + "/all_" + outputName + "_Basic_Stats.txt") as temp, open(temp, "w") as f:
+            f.write(stats.getvalue())
+
+        # What-if scenarios from the episode sizes just found
+        if df_scenarios is not None:
+            project_capacity(
                 DIRECTORY,
                 MonitorAppName[index],
-                MonitorDatabaseName[index],
-                TRAKDOCS,
-                False,
+                episode_sizes,
+                journal_gb_per_day.get(export_prefix(MonitorAppName[index])),
+                df_scenarios,
+                Years,
             )
 
     # Globals - takes a while, explicitly run it without -g option -------------------------
@@ -1113,77 +3130,36 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
 
         for filename in MonitorGlobalsName:
 
-            if not os.path.exists(DIRECTORY + "/all_globals"):
-                os.mkdir(DIRECTORY + "/all_globals")
+            os.makedirs(DIRECTORY + "/all_globals", exist_ok=True)
 
-            outputName = os.path.splitext(os.path.basename(filename))[0]
+            outputName = export_name(filename)
             outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_Summary"
             outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName + "_Summary"
 
             print("Globals: %s" % outputName)
 
-            df_master_gb = pd.read_csv(filename, sep="\t", encoding="ISO-8859-1")
+            df_master_gb = read_monitor(filename, "globals", last=True)
             df_master_gb = df_master_gb.dropna(axis=1, how="all")
             df_master_gb = df_master_gb.rename(columns={"RunDate": "Date"})
 
-            # substring mapping is a thing - one global can have many parts, need to break on path and Global
-            #  DataBasePath	        GlobalName	SizeAllocated
-            # /db/AUDIT0/	AUD	    57949
-            # /db/AUDIT1/	AUD	    103617
-            # /db/AUDIT2/	AUD	    45235
-            # /db/AUDIT3/	AUD	    41815
-            # etc
-
-            df_master_gb["DataBasePath"].replace("\\\\", "_", inplace=True, regex=True)
-            df_master_gb["DataBasePath"].replace(":", "_", inplace=True, regex=True)
-            df_master_gb["DataBasePath"].replace("/", "_", inplace=True, regex=True)
-            df_master_gb["DataBasePath"].replace("__", "", inplace=True, regex=True)
-
-            # Add full path name, Size recalculated in GB
-            df_master_gb["Full_Global"] = df_master_gb["DataBasePath"].str[1:] + df_master_gb["GlobalName"]
-            df_master_gb["SizeAllocatedGB"] = df_master_gb["SizeAllocated"] / 1024
-
-            # Get unique names and use that as a key to create a new dataframe per global
-            df_globals = pd.DataFrame({"Full_Global": df_master_gb.Full_Global.unique()})  # Get unique names
-
-            # Sort the dataframe, won't use an index - just to be sure it stil in date order
-            df_master_gb.sort_values(by=["Date", "Full_Global"], inplace=True)
-
-            # Create a summary dataframe that can be sorted
-            cols = ["Full_Global", "Start Size", "End Size", "Growth Size"]
-            lst = []
-
-            print("Please wait while globals growth calculated, this may take a while -- there a lot of them")
-            dots = "."
-
-            # Iterate over all the rows in the dataframe. Returns index and the whole row.
-            for index, row in df_globals.iterrows():
-
-                # For each row create a temporary dataframe with just that globals first and last rows.
-                df_temp = df_master_gb.loc[df_master_gb["Full_Global"] == row["Full_Global"]].iloc[[0, -1]]
-
-                # Create a list with full name, size at start, size at end (only 2 rows in df (0 and 1)), and difference (growth)
-                lst.append(
-                    [
-                        row["Full_Global"],
-                        df_temp["SizeAllocated"].iloc[0],
-                        df_temp["SizeAllocated"].iloc[1],
-                        df_temp["SizeAllocated"].iloc[1] - df_temp["SizeAllocated"].iloc[0],
-                    ]
-                )
-
-                # Something to look at
-                dots += "."
-                if dots == ".........................................................":
-                    dots = "."
-                print("\r" + dots, end="")
-            print("\n")
+            # Change points and forecast of every global, worked out in database path shards. The per-day rows are
+            # not needed after this, start/end/growth come straight from the change points. Saved for growth
+            # attribution and later runs.
+            row_count = len(df_master_gb)
+            histories, df_gb_forecast = process_globals(df_master_gb, Shards, ForecastDays)
+            del df_master_gb
+            histories.save(histories_file(DIRECTORY, filename))
+            print("%d globals, %d rows kept as %d changes" % (len(histories), row_count, len(histories.day)))
 
             # Create a dataframe with just the rows and columns we care about
-            df_globals_by_growth = pd.DataFrame(lst, columns=cols).sort_values(by=["Growth Size"], ascending=False)
-            df_globals_by_growth.to_csv(outputFile_csv + ".csv", sep=",", index=False)
+            # Ties in name order, so the ranking is the same however the globals were sharded
+            df_globals_by_growth = histories.summary().sort_values(
+                by=["Growth Size", "Full_Global"], ascending=[False, True]
+            )
+            write_csv(df_globals_by_growth, outputFile_csv + ".csv", sep=",", index=False)
 
-            df_globals_by_growth.head(TopNDatabaseByGrowth).to_csv(
+            write_csv(
+                df_globals_by_growth.head(TopNDatabaseByGrowth),
                 outputFile_csv + "_top_" + str(TopNDatabaseByGrowth) + ".csv",
                 sep=",",
                 index=False,
@@ -1194,149 +3170,177 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
 
             # Lets see the highest growth globals - bar chart
 
-            plt.style.use("seaborn-whitegrid")
-            current_palette_10 = sns.color_palette("Paired", TopNDatabaseByGrowth)
-            sns.set_palette(current_palette_10)
-
-            plt.figure(num=None, figsize=(16, 6), dpi=300)
-            index = np.arange(len(df_globals_by_growth["Full_Global"].head(TopNDatabaseByGrowth)))
-            plt.barh(
-                df_globals_by_growth["Full_Global"].head(TopNDatabaseByGrowth),
-                df_globals_by_growth["Growth Size"].head(TopNDatabaseByGrowth),
-            )
-
-            plt.title(
-                "Top " + str(TopNDatabaseByGrowth) + " - Globals by Growth  " + TITLEDATES,
-                fontsize=14,
-            )
-            plt.xlabel("Growth over period (MB)", fontsize=10)
-            plt.tick_params(labelsize=10)
-            plt.yticks(
-                index,
-                df_globals_by_growth["Full_Global"].head(TopNDatabaseByGrowth),
-                fontsize=10,
-            )
-            ax = plt.gca()
-            ax.xaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
-            plt.tight_layout()
-            plt.savefig(
-                outputFile_png + "_Top_" + str(TopNDatabaseByGrowth) + ".png",
-                format="png",
-            )
-            plt.close()
-
-            # Growth of top n globals - Not Stacked
-            df_master_gb["Date"] = pd.to_datetime(df_master_gb["Date"])
+            if DRAW_CHARTS:
+                plt.style.use("seaborn-whitegrid")
+                current_palette_10 = sns.color_palette("Paired", TopNDatabaseByGrowth)
+                sns.set_palette(current_palette_10)
 
-            grpd = df_master_gb.groupby("Full_Global")
-
-            plt.style.use("seaborn-whitegrid")
-            current_palette_10 = sns.color_palette("Paired", TopNDatabaseByGrowth)
-            sns.set_palette(current_palette_10)
+                plt.figure(num=None, figsize=(16, 6), dpi=300)
+                index = np.arange(len(df_globals_by_growth["Full_Global"].head(TopNDatabaseByGrowth)))
+                plt.barh(
+                    df_globals_by_growth["Full_Global"].head(TopNDatabaseByGrowth),
+                    df_globals_by_growth["Growth Size"].head(TopNDatabaseByGrowth),
+                )
 
-            plt.figure(num=None, figsize=(16, 6), dpi=300)
+                plt.title(
+                    "Top " + str(TopNDatabaseByGrowth) + " - Globals by Growth  " + TITLEDATES,
+                    fontsize=14,
+                )
+                plt.xlabel("Growth over period (MB)", fontsize=10)
+                plt.tick_params(labelsize=10)
+                plt.yticks(
+                    index,
+                    df_globals_by_growth["Full_Global"].head(TopNDatabaseByGrowth),
+                    fontsize=10,
+                )
+                ax = plt.gca()
+                ax.xaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+                plt.tight_layout()
+                save_figure(
+                    outputFile_png + "_Top_" + str(TopNDatabaseByGrowth) + ".png",
+                    format="png",
+                )
+                plt.close()
 
-            for name, data in grpd:
-                if name in top_List:
-                    plt.plot(data.Date.values, data.SizeAllocatedGB.values, "-", label=name)
-            plt.legend(loc="best")
+            # Forecast growth of every global (MB)
+            write_csv(
+                df_gb_forecast.sort_values(by=["Growth/Day", "Full_Global"], ascending=[False, True]),
+                outputFile_csv + "_Forecast_" + str(ForecastDays) + "_days.csv",
+                sep=",",
+            )
 
-            plt.title("Top Growth Globals Over Period  " + TITLEDATES, fontsize=14)
-            plt.ylabel("GB", fontsize=10)
-            plt.tick_params(labelsize=10)
-            ax = plt.gca()
-            ax.set_ylim(bottom=0)  # Always zero start
-            ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
-            ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
-            plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
-            plt.tight_layout()
-            plt.savefig(
-                outputFile_png + "_Top_" + str(TopNDatabaseByGrowth) + "_Growth.png",
-                format="png",
+            # Which globals grew the most on each day
+            df_gb_changes = histories.changes()
+            rank_tracking(
+                df_gb_changes[df_gb_changes["Growth"] > 0],
+                "Full_Global",
+                "Growth",
+                TopNDatabaseByGrowth,
+                "Growth",
+                outputFile_csv,
+                outputFile_png,
+                TITLEDATES,
             )
-            plt.close()
+
+            # Growth of top n globals - Not Stacked, the top N are expanded from their change points
+            LastGlobalDay = pd.Timestamp(histories.dates.max().astype("datetime64[D]"))
+            top_histories = {full_name: histories.history(full_name) for full_name in top_List}
+            for df_history in top_histories.values():
+                df_history["SizeAllocatedGB"] = df_history["SizeAllocated"] / 1024
+
+            if DRAW_CHARTS:
+                plt.style.use("seaborn-whitegrid")
+                current_palette_10 = sns.color_palette("Paired", TopNDatabaseByGrowth)
+                sns.set_palette(current_palette_10)
+
+                plt.figure(num=None, figsize=(16, 6), dpi=300)
+
+                for name, data in sorted(top_histories.items()):
+                    plot_downsampled(plt.gca(), data.Date.values, data.SizeAllocatedGB.values, "-", label=name)
+                plt.legend(loc="best")
+                plot_forecast_overlay(plt.gca(), df_gb_forecast, LastGlobalDay, ForecastDays, scale=1 / 1024)
+
+                plt.title("Top Growth Globals Over Period  " + TITLEDATES, fontsize=14)
+                plt.ylabel("GB", fontsize=10)
+                plt.tick_params(labelsize=10)
+                ax = plt.gca()
+                ax.set_ylim(bottom=0)  # Always zero start
+                ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+                ax.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
+                plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+                plt.tight_layout()
+                save_figure(
+                    outputFile_png + "_Top_" + str(TopNDatabaseByGrowth) + "_Growth.png",
+                    format="png",
+                )
+                plt.close()
 
             # Print the full history of the top N globals
             for full_name in top_List:
-                df_master_gb.loc[df_master_gb["Full_Global"] == full_name].to_csv(
-                    DIRECTORY + "/all_globals/Globals_" + full_name + ".csv",
+                write_csv(
+                    top_histories[full_name],
+                    DIRECTORY + "/all_globals/" + outputName + "_Globals_" + full_name + ".csv",
                     sep=",",
                     index=False,
                 )
 
-            # Set date index for individual plots
-            df_master_gb.set_index("Date", inplace=True)
-
-            x = 0
-            for full_name in top_List:
-                df_gb_top_ind = df_master_gb[df_master_gb.Full_Global == full_name]
-
-                TextString = (
-                    "Global size on disk at end : "
-                    + "{v:,.0f}".format(v=df_gb_top_ind.iloc[-1]["SizeAllocatedGB"])
-                    + " GB "
-                    + full_name
-                )
-                generic_plot(
-                    df_gb_top_ind,
-                    "SizeAllocatedGB",
-                    "Total Global Size on Disk _" + TITLEDATES,
-                    "(GB)",
-                    outputFile_png + "_" + str(x) + "_Ttl_Global_Size_On_Disk" + full_name + ".png",
-                    False,
-                    True,
-                    TextString,
-                )
-                x = x + 1
+            if DRAW_CHARTS:
+                chart = ChartTemplate("(GB)")
+                x = 0
+                for full_name in top_List:
+                    df_gb_top_ind = top_histories[full_name].set_index("Date")
+
+                    TextString = (
+                        "Global size on disk at end : "
+                        + "{v:,.0f}".format(v=df_gb_top_ind.iloc[-1]["SizeAllocatedGB"])
+                        + " GB "
+                        + full_name
+                    )
+                    chart.render(
+                        "Total Global Size on Disk _" + TITLEDATES,
+                        outputFile_png + "_" + str(x) + "_Ttl_Global_Size_On_Disk" + full_name + ".png",
+                        df_gb_top_ind.index.values,
+                        df_gb_top_ind["SizeAllocatedGB"].values,
+                        text=TextString,
+                    )
+                    x = x + 1
+                chart.close()
 
             # PIE chart of total global size
             # --------------------------------
 
             # Sort the summary dataframe by End Size
-            df_sorted = df_globals_by_growth.sort_values(by=["End Size"], ascending=False)
-            df_sorted.to_csv(outputFile_csv + "_pie.csv", sep=",", index=False)
+            df_sorted = df_globals_by_growth.sort_values(by=["End Size", "Full_Global"], ascending=[False, True])
+            write_csv(df_sorted, outputFile_csv + "_pie.csv", sep=",", index=False)
 
             Total_all_gb = df_sorted["End Size"].sum()
 
-            df_sorted["Labels"] = np.where(
-                df_sorted["End Size"] * 100 / Total_all_gb > 2,
-                df_sorted["Full_Global"],
-                "",
-            )
+            df_pie = pie_slices(df_sorted, "Full_Global", "End Size")
 
-            plt.style.use("seaborn-whitegrid")
-            current_palette_10 = sns.color_palette("Paired", 12)
-            sns.set_palette(current_palette_10)
-            plt.figure(num=None, figsize=(10, 6), dpi=300)
+            if DRAW_CHARTS:
+                plt.style.use("seaborn-whitegrid")
+                current_palette_10 = sns.color_palette("Paired", 12)
+                sns.set_palette(current_palette_10)
+                plt.figure(num=None, figsize=(10, 6), dpi=300)
 
-            pie_exp = tuple(0.1 if i < 2 else 0 for i in range(df_sorted["Full_Global"].count()))  # Pie explode
+                pie_exp = tuple(0.1 if i < 2 else 0 for i in range(len(df_pie)))  # Pie explode
 
-            plt.pie(
-                df_sorted["End Size"],
-                labels=df_sorted["Labels"],
-                autopct=make_autopct(df_sorted["End Size"]),
-                startangle=60,
-                explode=pie_exp,
-                shadow=True,
-            )
-            plt.title(
-                "Top Global Sizes at " + str(LastDay) + " - Total " + "{v:,.0f}".format(v=Total_all_gb / 1024) + " GB",
-                fontsize=14,
-            )
+                plt.pie(
+                    df_pie["End Size"],
+                    labels=df_pie["Labels"],
+                    autopct=make_autopct(df_pie["End Size"]),
+                    startangle=60,
+                    explode=pie_exp,
+                    shadow=True,
+                )
+                plt.title(
+                    "Top Global Sizes at "
+                    + str(LastDay)
+                    + " - Total "
+                    + "{v:,.0f}".format(v=Total_all_gb / 1024)
+                    + " GB",
+                    fontsize=14,
+                )
 
-            plt.axis("equal")
-            plt.tight_layout()
-            plt.savefig(outputFile_png + "_Total_global_Size_Pie_End.png")
-            plt.close()
+                plt.axis("equal")
+                plt.tight_layout()
+                save_figure(outputFile_png + "_Total_global_Size_Pie_End.png")
+                plt.close()
+
+        # Which globals drive the growth of each database
+        for index in range(min(len(MonitorGlobalsName), len(MonitorDatabaseName))):
+            growth_attribution(DIRECTORY, MonitorGlobalsName[index], MonitorDatabaseName[index])
+
+    # Databases and globals are done with, including any not paired up above
+    release_exports(MonitorDatabaseName + MonitorGlobalsName)
 
     # Page Summary
 
     for filename in MonitorPageSummaryName:
 
-        if not os.path.exists(DIRECTORY + "/all_pages"):
-            os.mkdir(DIRECTORY + "/all_pages")
+        os.makedirs(DIRECTORY + "/all_pages", exist_ok=True)
 
-        outputName = os.path.splitext(os.path.basename(filename))[0]
+        outputName = export_name(filename)
         outputFile_png = DIRECTORY + "/all_out_png/" + outputName + "_Summary"
         outputFile_csv = DIRECTORY + "/all_out_csv/" + outputName + "_Summary"
 
@@ -1345,7 +3349,7 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         # What are the high growth pages in this period?
         # Get glorefs, dont key by date as we will use this field
 
-        df_master_ps = pd.read_csv(filename, sep="\t", encoding="ISO-8859-1")
+        df_master_ps = read_monitor(filename)
         df_master_ps = df_master_ps.dropna(axis=1, how="all")
         df_master_ps = df_master_ps.rename(columns={"RunDate": "Date"})
 
@@ -1353,35 +3357,76 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         # mask = df_master_ps.SumPTime >0
         # df_master_ps.loc[mask, "AvgPTime"] = df_master_ps["SumPTime"] / df_master_ps["TotalHits"]
         df_master_ps["AvgPTime"] = df_master_ps["SumPTime"] / df_master_ps["TotalHits"]
-        df_master_ps.to_csv(outputFile_csv + "_df_master_ps.csv", sep=",")
+        write_csv(df_master_ps, outputFile_csv + "_df_master_ps.csv", sep=",")
 
         # Group by name Hits
         df_ps_by_TotalHits = df_master_ps.groupby(["pName"], sort=True).sum().reset_index()
         df_ps_by_TotalHits = df_ps_by_TotalHits.sort_values(by=["TotalHits"], ascending=[False])
-        df_ps_by_TotalHits.to_csv(outputFile_csv + "_Name_TotalHits.csv", sep=",")
+        write_csv(df_ps_by_TotalHits, outputFile_csv + "_Name_TotalHits.csv", sep=",")
 
         # Group by name SumPGlobals
         df_ps_by_SumPGlobals = df_master_ps.groupby(["pName"], sort=True).sum().reset_index()
         df_ps_by_SumPGlobals = df_ps_by_SumPGlobals.sort_values(by=["SumPGlobals"], ascending=[False])
-        df_ps_by_SumPGlobals.to_csv(outputFile_csv + "_Name_SumPGlobals.csv", sep=",")
+        write_csv(df_ps_by_SumPGlobals, outputFile_csv + "_Name_SumPGlobals.csv", sep=",")
 
         # Group by name AvgPGlobals
         df_ps_by_AvgPGlobals = df_master_ps.groupby(["pName"], sort=True).sum().reset_index()
         df_ps_by_AvgPGlobals = df_ps_by_AvgPGlobals.sort_values(by=["AvgPGlobals"], ascending=[False])
-        df_ps_by_AvgPGlobals.to_csv(outputFile_csv + "_Name_AvgPGlobals.csv", sep=",")
+        write_csv(df_ps_by_AvgPGlobals, outputFile_csv + "_Name_AvgPGlobals.csv", sep=",")
 
         # Group by name MaxPGlobals
         df_ps_by_MaxPGlobals = df_master_ps.groupby(["pName"], sort=True).sum().reset_index()
         df_ps_by_MaxPGlobals = df_ps_by_MaxPGlobals.sort_values(by=["MaxPGlobals"], ascending=[False])
-        df_ps_by_MaxPGlobals.to_csv(outputFile_csv + "_Name_MaxPGlobals.csv", sep=",")
+        write_csv(df_ps_by_MaxPGlobals, outputFile_csv + "_Name_MaxPGlobals.csv", sep=",")
 
         # Group by name SumPTime
         df_ps_by_SumPTime = df_master_ps.groupby(["pName"], sort=True).sum().reset_index()
         df_ps_by_SumPTime = df_ps_by_SumPTime.sort_values(by=["SumPTime"], ascending=[False])
-        df_ps_by_SumPTime.to_csv(outputFile_csv + "_Name_SumPTime.csv", sep=",")
+        write_csv(df_ps_by_SumPTime, outputFile_csv + "_Name_SumPTime.csv", sep=",")
 
         # Plot the top N by ....
-        df_master_ps["Date"] = pd.to_datetime(df_master_ps["Date"])
+        df_master_ps["Date"] = to_dates(df_master_ps["Date"])
+
+        # Day over day regressions for every page, not just the top N
+        df_ps_anomalies = page_anomalies(
+            df_master_ps, ["AvgPGlobals", "AvgPTime", "TotalHits"], AnomalyWindow, AnomalyThreshold
+        )
+        write_csv(df_ps_anomalies, outputFile_csv + "_Anomalies.csv", sep=",", index=False)
+        plot_anomalies(
+            df_master_ps,
+            df_ps_anomalies,
+            TopNDatabaseByGrowthStack,
+            AnomalyWindow,
+            "Top " + str(TopNDatabaseByGrowthStack) + " Page Anomalies (red) vs Baseline (dashed)  " + TITLEDATES,
+            outputFile_png + "_Top_" + str(TopNDatabaseByGrowthStack) + "_Anomalies.png",
+        )
+
+        # Top pages of each day for each metric
+        for metric in ["TotalHits", "SumPGlobals", "AvgPGlobals", "MaxPGlobals", "SumPTime"]:
+            rank_tracking(
+                df_master_ps, "pName", metric, TopNDatabaseByGrowth, metric, outputFile_csv, outputFile_png, TITLEDATES
+            )
+
+        # Every page on every day, hits against average globals. Busy and expensive pages are top right.
+        if DRAW_CHARTS:
+            plt.style.use("seaborn-whitegrid")
+            plt.figure(num=None, figsize=(10, 6), dpi=300)
+            ax = plt.gca()
+            raster_plot(
+                ax,
+                df_master_ps["TotalHits"],
+                df_master_ps["AvgPGlobals"],
+                log_x=True,
+                log_y=True,
+                log_color=True,
+                label="Page days",
+            )
+            plt.title("Hits and Average Globals, every page by day  " + TITLEDATES, fontsize=14)
+            plt.xlabel("Hits", fontsize=10)
+            plt.ylabel("Average Globals", fontsize=10)
+            plt.tight_layout()
+            save_figure(outputFile_png + "_Hits_AvgPGlobals_Density.png", format="png")
+            plt.close()
 
         generic_top_n(
             df_ps_by_SumPGlobals,
@@ -1489,52 +3534,483 @@ def mainline(DIRECTORY, TRAKDOCS, Do_Globals):
         # get top by sum globals and display charts
         top_List = df_ps_by_SumPGlobals["pName"].head(TopNDatabaseByGrowth).tolist()
 
-        plt.style.use("seaborn-whitegrid")
-        plt.figure(figsize=(16, 6), dpi=300)
-
-        x = 0
-        for name in top_List:
-            df_ps_top_ind = df_master_ps[df_master_ps.pName == name]
-            fig, ax1 = plt.subplots()
-            plt.gcf().set_size_inches(16, 6)
-            plt.gcf().set_dpi(300)
-            color = "g"
-            line1 = ax1.plot(df_ps_top_ind["AvgPGlobals"], color=color)
-            ax1.set_title(
-                "Average Globals and Time by day " + TITLEDATES + "\n" + name,
-                fontsize=14,
-            )
-            ax1.set_ylabel("Average Globals", fontsize=10, color=color)
-            ax1.tick_params(labelsize=10)
-            ax1.set_ylim(bottom=0)  # Always zero start
-            ax1.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
-            ax1.xaxis.set_major_formatter(mdates.AutoDateFormatter(mdates.WeekdayLocator(byweekday=MO)))
-
-            ax2 = ax1.twinx()
-            color = "b"
-            line2 = ax2.plot(df_ps_top_ind["AvgPTime"], color=color)
-            ax2.set_ylabel("Average Time", fontsize=10, color=color)
-            ax2.tick_params(labelsize=10)
-            ax2.set_ylim(bottom=0)  # Always zero start
-            ax2.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.2f}"))
-            ax2.grid(None)
-            # plot_text_string = ""
-            # fig.text(0.01,.95,plot_text_string, ha='left', va='center', transform=ax.transAxes, fontsize=12)
-
-            # added these three lines to get all labels in one legend
-            # lines = line1 + line2
-            # labels = [l.get_label() for l in lines]
-            # ax1.legend(lines, labels, loc="best")
-
-            plt.setp(ax1.get_xticklabels(), rotation=45, ha="right")
-            plt.tight_layout()
-            plt.savefig(
-                outputFile_png + "_" + str(x) + "_" + name + "_Globals_Time.png",
-                format="png",
-            )
-            plt.close(fig)
-            x = x + 1
+        if DRAW_CHARTS:
+            chart = ChartTemplate("Average Globals", twin_y_label="Average Time", color="g")
+            x = 0
+            for name in top_List:
+                df_ps_top_ind = df_master_ps[df_master_ps.pName == name]
+                chart.render(
+                    "Average Globals and Time by day " + TITLEDATES + "\n" + name,
+                    outputFile_png + "_" + str(x) + "_" + name + "_Globals_Time.png",
+                    df_ps_top_ind.index.values,
+                    df_ps_top_ind["AvgPGlobals"].values,
+                    y2=df_ps_top_ind["AvgPTime"].values,
+                )
+                x = x + 1
+            chart.close()
+
+    # Page workload per episode, pair up app and page summary exports like episode size
+    for index in range(min(len(MonitorAppName), len(MonitorPageSummaryName))):
+        cost_per_episode(DIRECTORY, MonitorAppName[index], MonitorPageSummaryName[index])
+    release_exports(MonitorAppName + MonitorPageSummaryName)
+
+    # Weekly and monthly rollups, cached in all_rollup
+    if Do_Rollups:
+        rollups(
+            DIRECTORY,
+            MonitorAppName,
+            MonitorDatabaseName,
+            [] if Do_Globals else MonitorGlobalsName,
+            MonitorPageSummaryName,
+        )
+
+    PREFETCHED.clear()
+    finish_run(DIRECTORY)
+    print("Finished\n")
+
+
+# Watch mode -------------------------------------------------------------------------
+# Poll root folders for site folders with new or changed *Monitor*.txt exports or archives of them. A site is
+# processed once its exports have stopped changing for settle seconds (still being copied otherwise). Sites run
+# in a bounded process pool; workers live for the whole watch so pandas and matplotlib are only imported once
+# per worker.
+
+
+# Site folder -> signature (name, size, mtime) of the exports in it, our own all_* output is skipped
+
+
+def find_exports(root):
+    sites = {}
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith("all_")]
+        for name in files:
+            if (fnmatch.fnmatch(name, "*Monitor*.txt*") or is_archive(name)) and not name.startswith(("all_", ".")):
+                try:
+                    stat = os.stat(os.path.join(folder, name))
+                except OSError:
+                    continue  # Moved or deleted while we looked
+                sites.setdefault(folder, []).append((name, stat.st_size, stat.st_mtime))
+    return {site: tuple(sorted(exports)) for site, exports in sites.items()}
+
+
+# Outputs newer than every export, nothing to do for this site on startup
+
+
+def already_processed(site, signature):
+    try:
+        return os.path.getmtime(site + "/all_out_csv") >= max(mtime for _, _, mtime in signature)
+    except OSError:
+        return False
+
+
+# options are the mainline() arguments after DIRECTORY, as keywords
+
+
+def watch(ROOTS, options, workers=2, interval=5, settle=10):
+    processed = {}  # site -> signature last processed
+    pending = {}  # site -> (signature, time first seen with this signature)
+    running = {}  # site -> future
+
+    for root in ROOTS:
+        for site, signature in find_exports(root).items():
+            if already_processed(site, signature):
+                processed[site] = signature
+
+    print("Watching: %s" % ", ".join(ROOTS))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            now = time.monotonic()
+            for root in ROOTS:
+                for site, signature in find_exports(root).items():
+                    if site in running or processed.get(site) == signature:
+                        continue
+                    if site not in pending or pending[site][0] != signature:
+                        pending[site] = (signature, now)  # New or still changing, wait for it to settle
+                    elif now - pending[site][1] >= settle:
+                        print("Watch: processing %s" % site)
+                        running[site] = pool.submit(mainline, site, **options)
+
+            for site, future in list(running.items()):
+                if future.done():
+                    del running[site]
+                    # Failures are not retried until the exports change again
+                    processed[site] = pending.pop(site)[0]
+                    try:
+                        future.result()
+                        print("Watch: finished %s" % site)
+                    except Exception as e:
+                        print("Watch: could not process %s because: %s" % (site, str(e)))
+
+            time.sleep(interval)
+
+
+# Serve mode -------------------------------------------------------------------------
+# Load databases, globals and page summary once and answer JSON queries over HTTP on localhost.
+# Query results and charts are memoized (LRU) so repeated questions don't touch the frames again.
+
+
+class MonitorQueries:
+    def __init__(self, DIRECTORY, cache_size=1024):
+        frames = {}
+        for kind, export, stage in [
+            ("databases", "MonitorDatabase", "episode_size_db"),
+            ("globals", "MonitorGlobals", "globals"),
+            ("pages", "MonitorPageSummary", "pages"),
+        ]:
+            files = monitor_exports(DIRECTORY, export)
+            if not files:
+                continue
+            print("Loading %s: %s" % (kind, ", ".join(export_name(f) for f in files)))
+            df = pd.concat([read_monitor(f, stage) for f in files], ignore_index=True)
+            df = df.rename(columns={"RunDate": "Date"})
+            df["Date"] = to_dates(df["Date"])
+            frames[kind] = df
+
+        if "databases" in frames:
+            frames["databases"]["DatabaseUsedMB"] = frames["databases"]["SizeinMB"] - frames["databases"]["FreeSpace"]
+        if "globals" in frames:
+            frames["globals"] = add_full_global(frames["globals"])
+        self.frames = frames
+
+        self.render_lock = threading.Lock()
+        self.database_growth = functools.lru_cache(maxsize=cache_size)(self._database_growth)
+        self.top_globals = functools.lru_cache(maxsize=cache_size)(self._top_globals)
+        self.top_pages = functools.lru_cache(maxsize=cache_size)(self._top_pages)
+        self.chart = functools.lru_cache(maxsize=cache_size // 8)(self._chart)
+
+    def _frame(self, kind, start, end):
+        if kind not in self.frames:
+            raise KeyError("no " + kind + " export loaded")
+        df = self.frames[kind]
+        if start:
+            df = df[df["Date"] >= pd.Timestamp(start)]
+        if end:
+            df = df[df["Date"] <= pd.Timestamp(end)]
+        return df
+
+    # One series per date, summed over rows for the same date
+    def _series(self, kind, name, metric, start, end):
+        column = {"databases": "Name", "globals": "Full_Global", "pages": "pName"}[kind]
+        df = self._frame(kind, start, end)
+        if name:
+            df = df[df[column] == name]
+        if df.empty:
+            raise KeyError("no data for " + (name or kind))
+        return df.groupby("Date")[metric].sum()
+
+    def _database_growth(self, name, start, end):
+        series = self._series("databases", name, "DatabaseUsedMB", start, end)
+        days = max((series.index[-1] - series.index[0]).days, 1)
+        growth = float(series.iloc[-1] - series.iloc[0])
+        return {
+            "database": name or "All Databases",
+            "start": series.index[0].strftime("%Y-%m-%d"),
+            "end": series.index[-1].strftime("%Y-%m-%d"),
+            "start_mb": float(series.iloc[0]),
+            "end_mb": float(series.iloc[-1]),
+            "growth_mb": growth,
+            "growth_mb_per_day": growth / days,
+            "peak_growth_mb_per_day": float(series.diff().max()) if len(series) > 1 else 0.0,
+        }
+
+    def _top_globals(self, n, start, end):
+        df = self._frame("globals", start, end).sort_values(by=["Date"])
+        grouped = df.groupby("Full_Global")["SizeAllocated"]
+        df_growth = pd.DataFrame({"Start Size": grouped.first(), "End Size": grouped.last()})
+        df_growth["Growth Size"] = df_growth["End Size"] - df_growth["Start Size"]
+        df_growth = df_growth.sort_values(by=["Growth Size"], ascending=False).head(n)
+        return df_growth.reset_index().to_dict(orient="records")
+
+    def _top_pages(self, metric, n, start, end):
+        df = self._frame("pages", start, end)
+        df_sum = df.groupby("pName")[metric].sum().sort_values(ascending=False).head(n)
+        return [{"pName": name, metric: float(value)} for name, value in df_sum.items()]
+
+    def _chart(self, kind, name, metric, start, end):
+        series = self._series(kind, name, metric, start, end)
+
+        # Figure (not pyplot) so it can render from any server thread, the plotting stack is loaded by serve()
+        from matplotlib.figure import Figure
+
+        with self.render_lock:
+            fig = Figure(figsize=(16, 6), dpi=100)
+            ax = fig.add_subplot()
+            plot_downsampled(ax, series.index.values, series.values)
+            ax.set_title((name or kind) + " " + metric, fontsize=14)
+            ax.grid(which="major", axis="both", linestyle="--")
+            ax.set_ylim(bottom=0)  # Always zero start
+            ax.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+            fig.autofmt_xdate(rotation=45, ha="right")
+            fig.tight_layout()
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png")
+        return buffer.getvalue()
+
+    # A numeric column of a loaded export, ValueError listing the valid ones if not
+
+    def metric(self, kind, metric):
+        if kind not in self.frames:
+            raise KeyError("no " + kind + " export loaded")
+        metrics = self.frames[kind].select_dtypes("number").columns
+        if metric not in metrics:
+            raise ValueError("unknown metric %s for %s, valid metrics are %s" % (metric, kind, ", ".join(metrics)))
+        return metric
+
+    def answer(self, path, query):
+        arg = lambda key, default="": query.get(key, [default])[0]  # noqa: E731
+        start, end = arg("start"), arg("end")
+        if path == "/database_growth":
+            return self.database_growth(arg("name"), start, end)
+        if path == "/top_globals":
+            return self.top_globals(int(arg("n", "15")), start, end)
+        if path == "/top_pages":
+            return self.top_pages(self.metric("pages", arg("metric", "SumPGlobals")), int(arg("n", "15")), start, end)
+        if path == "/chart.png":
+            if not DRAW_CHARTS:
+                raise ValueError("charts are off (--no_charts)")
+            kind = arg("kind", "databases")
+            if kind not in self.frames:
+                raise ValueError("unknown kind %s, loaded kinds are %s" % (kind, ", ".join(self.frames)))
+            metric = {"databases": "DatabaseUsedMB", "globals": "SizeAllocated", "pages": "SumPGlobals"}[kind]
+            return self.chart(kind, arg("name"), self.metric(kind, arg("metric", metric)), start, end)
+        if path == "/":
+            return {
+                "loaded": {kind: len(df) for kind, df in self.frames.items()},
+                "queries": [
+                    "/database_growth?name=TRAK-DATA&start=2021-01-01&end=2021-03-31",
+                    "/top_globals?n=15&start=&end=",
+                    "/top_pages?metric=SumPGlobals&n=15&start=&end=",
+                    "/chart.png?kind=databases|globals|pages&name=&metric=&start=&end=",
+                ],
+            }
+        return None
+
+
+def serve(DIRECTORY, port, Do_Charts=True):
+    use_charts(Do_Charts)
+    queries = MonitorQueries(DIRECTORY)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                result = queries.answer(url.path, parse_qs(url.query))
+            except (KeyError, ValueError) as e:
+                message = str(e.args[0]) if e.args else str(e)
+                self.reply(400, "application/json", json.dumps({"error": message}).encode())
+                return
+            if result is None:
+                self.reply(404, "application/json", json.dumps({"error": "unknown query " + url.path}).encode())
+            elif isinstance(result, bytes):
+                self.reply(200, "image/png", result)
+            else:
+                self.reply(200, "application/json", json.dumps(result, default=str).encode())
 
+        def reply(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Quiet, many queries per second
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print("Serving %s on http://127.0.0.1:%d/" % (DIRECTORY, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Finished serving\n")
+    finally:
+        server.server_close()
+
+
+# Compare mode -----------------------------------------------------------------------
+# Summarise the same exports before and after a change (two folders, or one folder split at a date eg an
+# upgrade), join the summaries on page, global and database name and rank what got worse.
+
+COMPARE_TOP_N = 20
+
+
+# Load pages, globals and databases for one side, date window as for the rest of the run
+
+
+def compare_frames(DIRECTORY, Do_Globals, since=None, until=None):
+    set_date_window(since, until)
+    frames = {}
+    for kind, export, stage in [
+        ("databases", "MonitorDatabase", "episode_size_db"),
+        ("globals", "MonitorGlobals", "globals"),
+        ("pages", "MonitorPageSummary", "pages"),
+    ]:
+        files = monitor_exports(DIRECTORY, export)
+        if not files or (kind == "globals" and Do_Globals):
+            continue
+        df = pd.concat([read_monitor(f, stage) for f in files], ignore_index=True)
+        df = df.rename(columns={"RunDate": "Date"})
+        df["Date"] = to_dates(df["Date"])
+        frames[kind] = df.sort_values(by=["Date"], kind="stable")
+
+    if "databases" in frames:
+        frames["databases"]["DatabaseUsedMB"] = frames["databases"]["SizeinMB"] - frames["databases"]["FreeSpace"]
+    if "globals" in frames:
+        frames["globals"] = add_full_global(frames["globals"])
+    return frames
+
+
+# Per name start, end and growth per day over the dates that side covers
+
+
+def growth_summary(df, name_column, value_column):
+    # Sum rows for the same name and date first (databases can have more than one row per day)
+    daily = df.groupby([name_column, "Date"])[value_column].sum().reset_index()
+    grouped = daily.groupby(name_column)
+    df_growth = pd.DataFrame(
+        {
+            "Days": (grouped["Date"].last() - grouped["Date"].first()).dt.days.clip(lower=1),
+            "End Size": grouped[value_column].last(),
+        }
+    )
+    df_growth["Growth/Day"] = (grouped[value_column].last() - grouped[value_column].first()) / df_growth["Days"]
+    return df_growth.reset_index()
+
+
+def page_summary(df):
+    df_pages = df.groupby("pName").agg(
+        Days=("Date", "nunique"),
+        TotalHits=("TotalHits", "sum"),
+        SumPGlobals=("SumPGlobals", "sum"),
+        SumPTime=("SumPTime", "sum"),
+    )
+    hits = df_pages["TotalHits"].where(df_pages["TotalHits"] > 0)
+    df_pages["Hits/Day"] = df_pages["TotalHits"] / df_pages["Days"]
+    df_pages["Globals/Day"] = df_pages["SumPGlobals"] / df_pages["Days"]
+    df_pages["Globals/Hit"] = df_pages["SumPGlobals"] / hits
+    df_pages["Time/Hit"] = df_pages["SumPTime"] / hits
+    return df_pages[["Hits/Day", "Globals/Day", "Globals/Hit", "Time/Hit"]].reset_index()
+
+
+# Outer join both sides on key, Delta and Change % for each metric, ranked by the Delta of the first metric.
+# Names on one side only are kept (new or removed pages, globals), "Seen In" says which.
+
+
+def compare_table(df_before, df_after, key, metrics):
+    df = pd.merge(
+        df_before[[key] + metrics],
+        df_after[[key] + metrics],
+        on=key,
+        how="outer",
+        suffixes=(" Before", " After"),
+        indicator="Seen In",
+    )
+    df["Seen In"] = df["Seen In"].map({"both": "Both", "left_only": "Before", "right_only": "After"})
+    for metric in metrics:
+        before, after = df[metric + " Before"], df[metric + " After"]
+        df[metric + " Delta"] = after.fillna(0) - before.fillna(0)
+        df[metric + " Change %"] = (after - before) * 100 / before.where(before != 0)
+    return df.sort_values(by=[metrics[0] + " Delta"], ascending=False).reset_index(drop=True)
+
+
+# Side by side before/after bars for the biggest deltas
+
+
+def plot_compare(df, key, metric, top_n, labels, title, x_label, save_as):
+    if not DRAW_CHARTS or df.empty:
+        return
+    df_top = df.head(top_n).iloc[::-1]  # Biggest at the top
+    index = np.arange(len(df_top))
+    height = 0.4
+
+    plt.style.use("seaborn-whitegrid")
+    plt.figure(num=None, figsize=(16, max(4, len(df_top) * 0.4)), dpi=300)
+    plt.barh(index - height / 2, df_top[metric + " Before"].fillna(0), height, label=labels[0], color="tab:blue")
+    plt.barh(index + height / 2, df_top[metric + " After"].fillna(0), height, label=labels[1], color="tab:red")
+    plt.yticks(index, df_top[key], fontsize=10)
+    plt.title(title, fontsize=14)
+    plt.xlabel(x_label, fontsize=10)
+    plt.tick_params(labelsize=10)
+    plt.legend(loc="lower right")
+    ax = plt.gca()
+    ax.xaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:,.0f}"))
+    plt.tight_layout()
+    save_figure(save_as, format="png")
+    plt.close()
+
+
+def compare(DIRECTORY, After=None, Split_Date=None, Do_Globals=False, Do_Charts=True, Since=None, Until=None):
+    use_charts(Do_Charts)
+
+    if Split_Date is not None:
+        last_before = (pd.Timestamp(Split_Date) - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        labels = ("Before " + Split_Date, "From " + Split_Date)
+        df_before = compare_frames(DIRECTORY, Do_Globals, Since, last_before)
+        df_after = compare_frames(DIRECTORY, Do_Globals, Split_Date, Until)
+    else:
+        labels = (os.path.basename(os.path.normpath(DIRECTORY)), os.path.basename(os.path.normpath(After)))
+        df_before = compare_frames(DIRECTORY, Do_Globals, Since, Until)
+        df_after = compare_frames(After, Do_Globals, Since, Until)
+    set_date_window(Since, Until)
+
+    OUTPUT = output_folder(DIRECTORY)
+    os.makedirs(OUTPUT + "/all_compare", exist_ok=True)
+    start_run(OUTPUT, [DIRECTORY] if After is None else [DIRECTORY, After])
+    output = OUTPUT + "/all_compare/Compare_"
+    TITLE = labels[0] + " vs " + labels[1]
+
+    tables = [
+        (
+            "pages",
+            "Pages",
+            "pName",
+            page_summary,
+            ["Globals/Hit", "Time/Hit", "Hits/Day", "Globals/Day"],
+            "Globals per Hit",
+        ),
+        (
+            "globals",
+            "Globals",
+            "Full_Global",
+            lambda df: growth_summary(df, "Full_Global", "SizeAllocated"),
+            ["Growth/Day", "End Size"],
+            "Growth per Day (MB)",
+        ),
+        (
+            "databases",
+            "Databases",
+            "Name",
+            lambda df: growth_summary(df, "Name", "DatabaseUsedMB"),
+            ["Growth/Day", "End Size"],
+            "Growth per Day (MB)",
+        ),
+    ]
+
+    for kind, name, key, summary, metrics, x_label in tables:
+        if kind not in df_before or kind not in df_after:
+            print("Compare %s: not in both exports, skipped" % name)
+            continue
+        if df_before[kind].empty or df_after[kind].empty:
+            print("Compare %s: no data on one side, skipped" % name)
+            continue
+        print("Compare: %s" % name)
+
+        df_compare = compare_table(summary(df_before[kind]), summary(df_after[kind]), key, metrics)
+        write_csv(df_compare, output + name + ".csv", sep=",", index=False)
+
+        # Regressions only, on names seen on both sides
+        df_worse = df_compare[(df_compare["Seen In"] == "Both") & (df_compare[metrics[0] + " Delta"] > 0)]
+        plot_compare(
+            df_worse,
+            key,
+            metrics[0],
+            COMPARE_TOP_N,
+            labels,
+            "Top " + str(COMPARE_TOP_N) + " " + name + " by Increase in " + x_label + "  " + TITLE,
+            x_label,
+            output + name + "_Top_" + str(COMPARE_TOP_N) + ".png",
+        )
+
+    finish_run(OUTPUT)
     print("Finished\n")
 
 
@@ -1543,7 +4019,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         prog="tc_monitor_unpack", description="TrakCare Monitor Process", epilog='Be safe, "quote the path"'
     )
-    parser.add_argument("-d", "--directory", help="Directory with Monitor files", required=True, metavar='"/path/path"')
+    parser.add_argument("-d", "--directory", help="Directory with Monitor files", metavar='"/path/path"')
     parser.add_argument(
         "-l",
         "--listofDBs",
@@ -1553,10 +4029,72 @@ if __name__ == "__main__":
     parser.add_argument(
         "-g", "--exclude_globals", help="Globals metrics take a long time and can be excluded", action="store_true"
     )
+    parser.add_argument(
+        "-s",
+        "--disk_size",
+        type=float,
+        help="Size of the database disk (GB), used to forecast days until the disk is full",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        nargs="+",
+        help="Keep running and process new or changed exports in site folders under these root folders",
+        metavar='"/path/path"',
+    )
+    parser.add_argument("--workers", type=int, default=2, help="Sites processed at the same time in watch mode")
+    parser.add_argument(
+        "-n", "--no_charts", help="Only csv and Basic_Stats output, don't load the plotting stack", action="store_true"
+    )
+    parser.add_argument("--since", help="Only use data from this date on", metavar="YYYY-MM-DD")
+    parser.add_argument("--until", help="Only use data up to and including this date", metavar="YYYY-MM-DD")
+    parser.add_argument(
+        "-r", "--rollups", help="Weekly and monthly rollup csv files (in all_rollup) and charts", action="store_true"
+    )
+    parser.add_argument(
+        "--scenarios", help="csv file of what-if scenarios to project episodes and sizes", metavar='"/path/file.csv"'
+    )
+    parser.add_argument("--years", type=int, default=5, help="Years to project what-if scenarios (default 5)")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Processes for globals, split by database path (0 = one per core, default 1)",
+    )
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Answer JSON queries on localhost about -d exports")
+    parser.add_argument(
+        "--compare", help="Compare -d (before) with exports in this folder (after)", metavar='"/path/path"'
+    )
+    parser.add_argument("--compare_at", help="Compare -d exports before and from this date", metavar="YYYY-MM-DD")
     # parser.add_argument("-p", "--page", help="Page Summary take a long time", action="store_true")
 
     args = parser.parse_args()
 
+    if args.listofDBs is not None:
+        TRAKDOCS = args.listofDBs
+    else:
+        TRAKDOCS = [""]
+
+    options = {
+        "TRAKDOCS": TRAKDOCS,
+        "Do_Globals": args.exclude_globals,
+        "Disk_Size": args.disk_size,
+        "Do_Charts": not args.no_charts,
+        "Since": args.since,
+        "Until": args.until,
+        "Do_Rollups": args.rollups,
+        "Scenarios": args.scenarios,
+        "Years": args.years,
+        "Shards": args.shards,
+    }
+
+    if args.watch is not None:
+        try:
+            watch(args.watch, options, args.workers)
+        except KeyboardInterrupt:
+            print("Finished watching\n")
+        sys.exit()
+
     if args.directory is not None:
         DIRECTORY = args.directory
         try:
@@ -1568,16 +4106,40 @@ if __name__ == "__main__":
         except OSError as e:
             print("Could not process files because: {}".format(str(e)))
             sys.exit()
+        if os.path.isfile(DIRECTORY) and not (is_archive(DIRECTORY) or is_export(DIRECTORY)):
+            print(
+                'Error: -d "%s" is not a folder, an archive (.zip, .tar.gz, .tgz) or a Monitor export (.txt, .txt.gz)'
+                % DIRECTORY
+            )
+            sys.exit()
     else:
         print('Error: -d "Directory with Monitor files"')
         sys.exit()
 
-    if args.listofDBs is not None:
-        TRAKDOCS = args.listofDBs
-    else:
-        TRAKDOCS = [""]
+    if args.serve is not None:
+        set_date_window(args.since, args.until)
+        serve(DIRECTORY, args.serve, not args.no_charts)
+        sys.exit()
+
+    if args.compare is not None or args.compare_at is not None:
+        if args.compare is not None and args.compare_at is not None:
+            print("Error: use --compare or --compare_at, not both")
+            sys.exit()
+        try:
+            compare(
+                DIRECTORY,
+                args.compare,
+                args.compare_at,
+                args.exclude_globals,
+                not args.no_charts,
+                args.since,
+                args.until,
+            )
+        except OSError as e:
+            print("Could not process files because: {}".format(str(e)))
+        sys.exit()
 
     try:
-        mainline(DIRECTORY, TRAKDOCS, args.exclude_globals)
+        mainline(DIRECTORY, **options)
     except OSError as e:
         print("Could not process files because: {}".format(str(e)))
@@ -0,0 +1,229 @@
+# Behaviour of the numeric and naming helpers in tc_monitor_unpack.py, run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tc_monitor_unpack as tc  # noqa: E402
+
+# Downsampling ---------------------------------------------------------------------------
+
+
+def test_downsample_short_series_unchanged():
+    x, y = np.arange(10), np.arange(10.0)
+    x_out, y_out = tc.downsample_minmax(x, y, 100)
+    assert np.array_equal(x_out, x) and np.array_equal(y_out, y)
+
+
+def test_downsample_keeps_ends_and_extremes():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=100000)
+    y[12345], y[67890] = 50.0, -50.0
+    y[500] = np.nan
+    x_out, y_out = tc.downsample_minmax(np.arange(len(y)), y, 1000)
+    assert len(y_out) <= 1000 + 2
+    assert x_out[0] == 0 and x_out[-1] == len(y) - 1
+    assert 12345 in x_out and 67890 in x_out
+    assert 500 not in x_out  # NaN is never a bucket min or max
+
+
+# Dates ----------------------------------------------------------------------------------
+
+
+def test_detect_date_format():
+    assert tc.detect_date_format(pd.Series(["2026-01-02", "2026-01-13"])) == "%Y-%m-%d"
+    assert tc.detect_date_format(pd.Series(["01/02/2026", "13/02/2026"])) == "%d/%m/%Y"
+    assert tc.detect_date_format(pd.Series(["02/01/2026", "02/13/2026"])) == "%m/%d/%Y"
+
+
+def test_detect_date_format_ambiguous_is_unresolved():
+    dates = pd.Series(["01/02/2026", "03/04/2026"])
+    assert tc.detect_date_format(dates) is None
+    assert tc.date_formats(dates) == ["%d/%m/%Y", "%m/%d/%Y"]
+
+
+def test_to_dates_does_not_share_unresolved_dates():
+    tc.to_dates(pd.Series(["01/02/2026", "03/04/2026"]))
+    day_first = tc.to_dates(pd.Series(["01/02/2026", "13/04/2026"]))
+    month_first = tc.to_dates(pd.Series(["01/02/2026", "04/13/2026"]))
+    assert day_first[0] == pd.Timestamp("2026-02-01")
+    assert month_first[0] == pd.Timestamp("2026-01-02")
+    assert None not in tc.DATE_MEMO
+
+
+# Forecasts ------------------------------------------------------------------------------
+
+
+def forecast_frame():
+    dates = pd.date_range("2026-01-01", periods=30)
+    return pd.DataFrame(
+        {
+            "Date": np.concatenate([dates, dates]),
+            "Name": ["A"] * 30 + ["B"] * 30,
+            "Value": np.concatenate([100 + 2.0 * np.arange(30), np.full(30, 50.0)]),
+        }
+    )
+
+
+def test_forecast_growth_straight_line():
+    df_forecast = tc.forecast_growth(forecast_frame(), "Name", "Value", 10)
+    a, b = df_forecast.loc["A"], df_forecast.loc["B"]
+    assert a["Growth/Day"] == pytest.approx(2.0)
+    assert a["R2"] == pytest.approx(1.0)
+    assert a["Projected"] == pytest.approx(100 + 2.0 * 39)
+    assert a["Upper"] - a["Lower"] == pytest.approx(0.0, abs=1e-6)
+    assert b["Growth/Day"] == pytest.approx(0.0) and np.isnan(b["R2"])
+
+
+def test_forecast_growth_missing_days_carry_no_weight():
+    df = forecast_frame()
+    df = df[~((df["Name"] == "A") & (df["Date"].dt.day % 3 == 0))]
+    a = tc.forecast_growth(df, "Name", "Value", 10).loc["A"]
+    assert a["Growth/Day"] == pytest.approx(2.0)
+    assert a["Days"] == 20
+
+
+def test_forecast_growth_days_until_limit():
+    df_forecast = tc.forecast_growth(forecast_frame(), "Name", "Value", 10, limit=200.0)
+    assert df_forecast.loc["A", "Days Until Limit"] == pytest.approx((200 - 158) / 2.0)
+    assert np.isnan(df_forecast.loc["B", "Days Until Limit"])  # Not growing, never reaches it
+
+
+# Page anomalies -------------------------------------------------------------------------
+
+
+def pages_frame():
+    dates = pd.date_range("2026-01-01", periods=30)
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({"Date": dates, "pName": "p", "TotalHits": 100 + rng.integers(-3, 4, 30).astype(float)})
+    df["SumPTime"] = 50.0
+    return df
+
+
+def test_page_anomalies_finds_spike():
+    df = pages_frame()
+    df.loc[20, "TotalHits"] = 1000
+    df_anomalies = tc.page_anomalies(df, ["TotalHits"], 14, 3.5)
+    assert df_anomalies.iloc[0]["Date"] == df.loc[20, "Date"]
+    assert df_anomalies.iloc[0]["Robust Z"] > 3.5
+
+
+def test_page_anomalies_ignores_non_finite_ratios():
+    df = pages_frame()
+    df.loc[20, "TotalHits"] = 0
+    df["AvgPTime"] = df["SumPTime"] / df["TotalHits"]
+    df_anomalies = tc.page_anomalies(df, ["AvgPTime"], 14, 3.5)
+    assert np.isfinite(df_anomalies["Robust Z"]).all()
+    assert np.isfinite(df_anomalies["Value"]).all()
+
+
+# Correlation ----------------------------------------------------------------------------
+
+
+def test_masked_correlation_matches_corrcoef():
+    rng = np.random.default_rng(2)
+    E = rng.normal(size=(50, 2))
+    X = np.column_stack([E[:, 0] * 3 + rng.normal(size=50), rng.normal(size=50)])
+    r = tc.masked_correlation(X, E)
+    for i in range(2):
+        for j in range(2):
+            assert r[i, j] == pytest.approx(np.corrcoef(X[:, i], E[:, j])[0, 1])
+
+
+def test_masked_correlation_skips_missing_and_short():
+    rng = np.random.default_rng(3)
+    E = rng.normal(size=(20, 1))
+    X = np.column_stack([E[:, 0] * 2, np.full(20, np.nan)])
+    X[5, 0] = np.nan
+    X[:2, 1] = [1.0, 2.0]
+    r = tc.masked_correlation(X, E)
+    assert r[0, 0] == pytest.approx(1.0)
+    assert np.isnan(r[1, 0])  # Fewer than 3 days
+
+
+# Global histories -----------------------------------------------------------------------
+
+
+def globals_frame():
+    rng = np.random.default_rng(4)
+    days = pd.date_range("2025-11-03", periods=90)
+    rows = []
+    for g in range(20):
+        first, last = sorted(rng.integers(0, 90, 2))
+        size = 100
+        for day in days[first : last + 1]:
+            if rng.random() < 0.3:
+                size += int(rng.integers(-20, 30))
+            rows.append((day, "G%02d" % g, size))
+    return pd.DataFrame(rows, columns=["Date", "Full_Global", "SizeAllocated"])
+
+
+def test_global_histories_summary_and_history():
+    df = globals_frame()
+    histories = tc.GlobalHistories.from_frame(df, np.full(len(df), "/db/data/"))
+    assert len(histories.day) < len(df)
+
+    grouped = df.groupby("Full_Global")["SizeAllocated"]
+    summary = histories.summary().set_index("Full_Global").sort_index()
+    assert (summary["Start Size"] == grouped.first()).all()
+    assert (summary["End Size"] == grouped.last()).all()
+
+    for name, df_global in df.groupby("Full_Global"):
+        expanded = histories.history(name)
+        assert expanded["SizeAllocated"].tolist() == df_global["SizeAllocated"].tolist()
+
+
+def test_global_histories_rollup_matches_rows():
+    df = globals_frame()
+    histories = tc.GlobalHistories.from_frame(df, np.full(len(df), "/db/data/"))
+    aggregations = {"SizeAllocated End": ("SizeAllocated", "last"), "SizeAllocated Max": ("SizeAllocated", "max")}
+    for period in ["W", "M"]:
+        pd.testing.assert_frame_equal(
+            histories.rollup(period),
+            tc.rollup_table(df, ["Full_Global"], aggregations, period),
+            check_dtype=False,
+        )
+
+
+def test_global_histories_save_load_merge(tmp_path):
+    df = globals_frame()
+    parts = [df[df["Full_Global"] < "G10"], df[df["Full_Global"] >= "G10"]]
+    histories = tc.GlobalHistories.merge(
+        [tc.GlobalHistories.from_frame(part, np.full(len(part), "c:\\db\\data\\")) for part in parts]
+    )
+    path = str(tmp_path / "all_globals" / "SITE_MonitorGlobals_Histories.npz")
+    histories.save(path)
+    loaded = tc.GlobalHistories.load(path)  # Plain arrays, no pickles
+    assert loaded.names.tolist() == histories.names.tolist()
+    assert loaded.paths.tolist() == ["c:\\db\\data\\"] * len(loaded)
+    pd.testing.assert_frame_equal(
+        loaded.summary().sort_values("Full_Global", ignore_index=True),
+        tc.GlobalHistories.from_frame(df, np.full(len(df), "")).summary().sort_values("Full_Global", ignore_index=True),
+    )
+
+
+# Names and paths ------------------------------------------------------------------------
+
+
+def test_path_key():
+    paths = pd.Series(["c:\\InterSystems\\db\\data\\", "/trak/db/data/", "C:/InterSystems/DB/Data"])
+    assert tc.path_key(paths).tolist() == ["C_INTERSYSTEMS_DB_DATA", "TRAK_DB_DATA", "C_INTERSYSTEMS_DB_DATA"]
+
+
+def test_export_names_and_kinds():
+    member = "/data/MonitorDatabase_backup.zip" + tc.ARCHIVE_SEP + "export/SITE_MonitorApp.txt"
+    assert tc.export_name(member) == "MonitorDatabase_backup_SITE_MonitorApp"
+    assert tc.export_kind(member) == "MonitorApp"
+    assert tc.export_prefix(member) == "MonitorDatabase_backup_SITE_"
+    assert tc.export_name("/data/SITE_MonitorGlobals.txt.gz") == "SITE_MonitorGlobals"
+    assert tc.export_kind("/data/notes.txt") is None
+
+
+def test_output_path_flattens_names():
+    assert tc.output_path("/d/all_out_png/SITE_Top_trak/db/x.png") == "/d/all_out_png/SITE_Top_trak_db_x.png"
+    assert tc.output_path("/d/all_SITE_Basic_Stats.txt") == "/d/all_SITE_Basic_Stats.txt"